@@ -1,24 +1,33 @@
+import json
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import faiss
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 
-from config import DATA_DIR, CHUNK_SIZE, EMBEDDING_DIR
-from db import init_db, add_doc, remove_doc, list_docs, reset_db, get_all_chunks
-from embeddings import build_embeddings
-from llm import query_llm
-from prompt import get_prompt
-from retrieval import retrieve_chunks
-from utils import (
-    extract_text_from_pdf,
-    extract_text_from_docx,
-    chunk_text,
-    allowed_file,
-    extract_sources,
+from config import (
+    DATA_DIR, EMBEDDING_DIR, BATCH_LLM_CONCURRENCY, BATCH_MAX_QUESTIONS, DOCS_PAGE_MAX, RETRIEVAL_MODE,
+    CONTEXT_CANDIDATES, RERANK_ENABLED, WARMUP,
 )
+from context import pack_prompt
+from db import init_db, remove_doc, list_docs, reset_db, count_chunks, count_docs, corpus_version
+from cache import answer_cache, score_cache
+from embeddings import active_model, get_cache_stats, get_embedding, model_id, query_batcher
+from index import remove_from_index, delete_index, index_stamp, init_index, list_generations
+from ingest import INGEST_STAGES, BULK_INGEST_STAGES, REINDEX_STAGES, ingest_file, ingest_files, rebuild_index, reindex
+from jobs import job_queue
+from llm import LLMBusy, llm_client, query_llm, stream_llm
+from metrics import (
+    CACHE_LOOKUPS, CHUNKS, DOCUMENTS, PROMPT_TOKENS, REQUESTS, REQUEST_SECONDS, collect_timings, iter_collecting,
+    observe, render, timed,
+)
+from rerank import rerank, rerank_batch
+from retrieval import RETRIEVAL_MODES, retriever, retrieve_chunks, retrieve_chunks_batch
+from startup import queue_legacy_rebuild, readiness, start_warm_up
+from utils import allowed_file, extract_sources
 
 logging.basicConfig(level=logging.INFO)
 logging.info("🔍 Logging configured and working!")
@@ -33,101 +42,414 @@ os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(EMBEDDING_DIR, exist_ok=True)
 
 init_db()
-
-INDEX_PATH = os.path.join(EMBEDDING_DIR, "document_index.faiss")
+init_index(model_id())
+if active_model() != model_id():
+    logging.warning(
+        f"Serving an index encoded with {active_model()} while EMBEDDING_MODEL is {model_id()}; "
+        "POST /index/rebuild to re-embed into a new generation (queries keep using the current one meanwhile)."
+    )
 
 
 # ---------------------------
 # Helpers
 # ---------------------------
-def rebuild_index():
-    """Rebuild FAISS index from all chunks in DB."""
-    chunks = get_all_chunks()
-    if not chunks:
-        if os.path.exists(INDEX_PATH):
-            os.remove(INDEX_PATH)
-        return None
-
-    texts = [c["text"] for c in chunks]
-    index, _ = build_embeddings(texts)
-    faiss.write_index(index, INDEX_PATH)
-    return index
+def format_sources(answer, context_chunks):
+    """Map the sources cited in an answer to snippets for the frontend."""
+    # Extract cited sources from LLM answer
+    cited_sources = extract_sources(answer)
+
+    # Fallback: include actual retrieved docs
+    if not cited_sources or "unknown" in cited_sources:
+        seen = set()
+        cited_sources = []
+        for chunk in context_chunks:
+            doc = chunk["source"]
+            if doc not in seen:
+                cited_sources.append(doc)
+                seen.add(doc)
+
+    # Format sources for frontend
+    sources_formatted = []
+    for doc in cited_sources:
+        snippet = ""
+        pages = None
+        confidence = None  # cross-encoder or cosine relevance of the best chunk, when known
+        for chunk in context_chunks:
+            if chunk["source"] == doc:
+                snippet = chunk["text"][:300]  # short preview
+                confidence = chunk.get("relevance")
+                if chunk.get("page_start") is not None:
+                    pages = [chunk["page_start"], chunk["page_end"]]
+                break
+        sources_formatted.append(
+            {"doc": doc, "snippet": snippet, "confidence": confidence, "pages": pages}
+        )
+    return sources_formatted
 
 
-# ---------------------------
-# Routes
-# ---------------------------
-@app.route("/ask", methods=["GET", "POST"])
-def ask():
-    allow_fallback = False
+def parse_question():
+    """
+    Read (question, options) from a GET or POST /ask request.
+    options is None when a POST body is not a JSON object.
+    """
     # Support GET (for Streamlit) or POST (future API clients)
     if request.method == "POST":
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return None, None
         user_question = data.get("question")
-        allow_fallback = data.get("allow_fallback", False)
+        options = {
+            "allow_fallback": data.get("allow_fallback", False),
+            "mode": data.get("retrieval_mode", RETRIEVAL_MODE),
+            "docs": data.get("docs") or None,
+        }
     else:
         user_question = request.args.get("q")
+        options = {
+            "allow_fallback": request.args.get("allow_fallback", "false").lower() == "true",
+            "mode": request.args.get("retrieval_mode", RETRIEVAL_MODE),
+            "docs": request.args.getlist("docs") or None,  # ?docs=a.pdf&docs=b.pdf
+        }
+    return user_question, options
 
-    if not user_question:
-        return jsonify({"error": "No question provided"}), 400
-
-    logging.info(f"Received question: {user_question} allow_fallback: {allow_fallback} ")
 
-    try:
-        # Retrieve context chunks
-        context_chunks = retrieve_chunks(user_question)
-
-        # Build context text for LLM
-        context_text = "\n\n".join(
-            f"[Source: {chunk.get('source', f'retrieved_doc_{i + 1}')}]"
-            f"\n{chunk['text']}"
-            for i, chunk in enumerate(context_chunks)
+def docs_error(docs):
+    """Validation message for a `docs` filter (None = whole corpus), or None."""
+    if docs is None:
+        return None
+    if not isinstance(docs, list) or not all(isinstance(d, str) for d in docs):
+        return "docs must be a list of filenames"
+    unknown = set(docs) - {d["filename"] for d in list_docs()}
+    if unknown:
+        return f"Unknown docs: {', '.join(sorted(unknown))}"
+    return None
+
+
+def options_error(options):
+    """Validation message for bad request options, or None."""
+    if not isinstance(options["allow_fallback"], bool):
+        return "allow_fallback must be true or false"
+    if options["mode"] not in RETRIEVAL_MODES:
+        return f"retrieval_mode must be one of {', '.join(RETRIEVAL_MODES)}"
+    return docs_error(options["docs"])
+
+
+def cache_variant(options):
+    """Request options that change the answer, as part of the answer-cache key."""
+    docs = tuple(sorted(set(options["docs"]))) if options["docs"] else None
+    return options["allow_fallback"], options["mode"], docs
+
+
+def retrieve_candidates(user_question, q_emb, q_model, mode, docs=None):
+    """
+    Over-fetch context candidates (only from `docs` when given), reranked by the
+    cross-encoder when RERANK_ENABLED.
+    """
+    with timed("retrieval"):
+        candidates = retrieve_chunks(
+            user_question, CONTEXT_CANDIDATES, q_emb=q_emb, mode=mode, docs=docs, q_model=q_model
         )
+    if RERANK_ENABLED:
+        with timed("rerank"):
+            candidates = rerank(user_question, candidates)
+    return candidates
+
+
+def build_prompt(user_question, candidates, allow_fallback=False):
+    """pack_prompt, timed as the "context" stage."""
+    with timed("context"):
+        context_chunks, prompt, prompt_tokens = pack_prompt(user_question, candidates, allow_fallback)
+    PROMPT_TOKENS.observe(prompt_tokens)
+    return context_chunks, prompt, prompt_tokens
+
 
-        # Build prompt
-        prompt = get_prompt(context_text, user_question, allow_fallback=allow_fallback)
+def answer_question(user_question, candidates, allow_fallback=False):
+    """Pack the retrieved candidates into a prompt, query the LLM and format the response."""
+    # Build prompt
+    context_chunks, prompt, prompt_tokens = build_prompt(user_question, candidates, allow_fallback)
 
-        # Query local LLM
+    # Query local LLM
+    with timed("llm"):
         choice = query_llm(prompt)
-        answer = choice.get("content", "")
-        reasoning = choice.get("reasoning", "")
-
-        # Extract cited sources from LLM answer
-        cited_sources = extract_sources(answer)
-
-        # Fallback: include actual retrieved docs
-        if not cited_sources or "unknown" in cited_sources:
-            seen = set()
-            cited_sources = []
-            for chunk in context_chunks:
-                doc = chunk["source"]
-                if doc not in seen:
-                    cited_sources.append(doc)
-                    seen.add(doc)
-
-        # Format sources for frontend
-        sources_formatted = []
-        for doc in cited_sources:
-            snippet = ""
-            confidence = 1.0  # For MVP, set 1.0 or calculate similarity later
-            for chunk in context_chunks:
-                if chunk["source"] == doc:
-                    snippet = chunk["text"][:300]  # short preview
-                    break
-            sources_formatted.append(
-                {"doc": doc, "snippet": snippet, "confidence": confidence}
-            )
+    answer = choice.get("content", "")
+
+    return {
+        "question": user_question,
+        "answer": answer,
+        "reasoning": choice.get("reasoning", ""),
+        "sources": format_sources(answer, context_chunks),
+        "prompt_tokens": prompt_tokens,
+    }
+
+
+def answer_with_timings(user_question, candidates, allow_fallback=False):
+    """answer_question for a pool thread, with its own stage timings."""
+    with collect_timings() as timings:
+        result = answer_question(user_question, candidates, allow_fallback)
+    return {**result, "timings": timings}
+
+
+def lookup_cached_answer(user_question, options):
+    """
+    Check the answer cache before retrieval and generation.
+    Returns (cached result or None, query embedding or None, the model that
+    encoded it, cache version).
+    """
+    # Other server workers may have changed the corpus (or published a generation)
+    answer_cache.sync(index_stamp())
+    version = answer_cache.version
+    cached = answer_cache.get_exact(user_question, cache_variant(options))
+    if cached is not None:
+        CACHE_LOOKUPS.labels("answer", "exact").inc()
+        return {**cached, "question": user_question, "cached": "exact"}, None, None, version
+
+    q_model = active_model()
+    q_emb = get_embedding(user_question, q_model)
+    cached, similarity = answer_cache.get_similar(q_emb, cache_variant(options))
+    CACHE_LOOKUPS.labels("answer", "semantic" if cached is not None else "miss").inc()
+    if cached is not None:
+        result = {**cached, "question": user_question, "cached": "semantic"}
+        result["cache_similarity"] = similarity
+        return result, q_emb, q_model, version
+    return None, q_emb, q_model, version
+
+
+def invalidate_answers():
+    """Cached answers depend on the corpus; drop them whenever it changes."""
+    answer_cache.invalidate()
+
+
+def llm_busy_response(e):
+    """Fail fast while the LLM queue is saturated, telling the client when to retry."""
+    logging.warning(f"LLM busy: {e}")
+    return jsonify({"error": str(e), "retry_after": e.retry_after}), e.status, {"Retry-After": str(e.retry_after)}
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# ---------------------------
+# Request metrics
+# ---------------------------
+@app.before_request
+def start_timer():
+    g.start_time = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    # Streamed responses are counted when their headers go out
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUEST_SECONDS.labels(endpoint, request.method).observe(time.perf_counter() - g.start_time)
+    REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+    return response
+
+
+# ---------------------------
+# Routes
+# ---------------------------
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
 
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: the embedding model and the FAISS index are loaded."""
+    ready, details = readiness()
+    return jsonify({"ready": ready, **details}), 200 if ready else 503
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint: stage latencies, caches, LLM queue, jobs and corpus size."""
+    DOCUMENTS.set(count_docs())
+    CHUNKS.set(count_chunks())
+    body, content_type = render()
+    return Response(body, content_type=content_type)
+
+
+@app.route("/ask", methods=["GET", "POST"])
+def ask():
+    user_question, options = parse_question()
+    if options is None:
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    if not isinstance(user_question, str) or not user_question:
+        return jsonify({"error": "No question provided"}), 400
+    if options_error(options):
+        return jsonify({"error": options_error(options)}), 400
+
+    logging.info(f"Received question: {user_question} options: {options} ")
+
+    try:
+        with collect_timings() as timings:
+            cached, q_emb, q_model, version = lookup_cached_answer(user_question, options)
+            if cached is not None:
+                # The stored timings are the original request's; report this lookup's
+                return jsonify({**cached, "timings": {**timings, "total": time.perf_counter() - g.start_time}})
+
+            # Retrieve context chunks
+            # Over-fetch candidates; answer_question packs the best of them into the prompt
+            candidates = retrieve_candidates(user_question, q_emb, q_model, options["mode"], options["docs"])
+            result = answer_question(user_question, candidates, options["allow_fallback"])
+        result = {**result, "timings": {**timings, "total": time.perf_counter() - g.start_time}}
+        answer_cache.put(user_question, cache_variant(options), q_emb, result, version)
+        result = {**result, "cached": False}
+    except LLMBusy as e:
+        return llm_busy_response(e)
     except Exception as e:
         logging.error(f"Query error: {e}")
         return jsonify({"error": str(e)}), 500
 
-    return jsonify({
-        "question": user_question,
-        "answer": answer,
-        "reasoning": reasoning,
-        "sources": sources_formatted
-    })
+    return jsonify(result)
+
+
+@app.route("/ask/batch", methods=["POST"])
+def ask_batch():
+    """
+    Answer many questions at once.
+    Questions are embedded in one batch and searched in one FAISS call, then
+    sent to the LLM with bounded concurrency. Results stream back as JSON lines
+    in completion order, each tagged with its position in the input.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    questions = data.get("questions")
+    allow_fallback = data.get("allow_fallback", False)
+    mode = data.get("retrieval_mode", RETRIEVAL_MODE)
+    docs = data.get("docs") or None
+    concurrency = data.get("concurrency", BATCH_LLM_CONCURRENCY)
+
+    if not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1:
+        return jsonify({"error": "concurrency must be a positive integer"}), 400
+    if not isinstance(allow_fallback, bool):
+        return jsonify({"error": "allow_fallback must be true or false"}), 400
+    # Callers may lower concurrency but never exceed the server limit
+    concurrency = min(concurrency, BATCH_LLM_CONCURRENCY)
+
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q for q in questions):
+        return jsonify({"error": "Provide 'questions' as a non-empty list of strings"}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({"error": f"At most {BATCH_MAX_QUESTIONS} questions per batch"}), 400
+    if mode not in RETRIEVAL_MODES:
+        return jsonify({"error": f"retrieval_mode must be one of {', '.join(RETRIEVAL_MODES)}"}), 400
+    if docs_error(docs):
+        return jsonify({"error": docs_error(docs)}), 400
+
+    logging.info(f"Received batch of {len(questions)} questions allow_fallback: {allow_fallback}")
+
+    try:
+        start = time.perf_counter()
+        batch_chunks = retrieve_chunks_batch(questions, CONTEXT_CANDIDATES, mode=mode, docs=docs)
+        if RERANK_ENABLED:
+            retrieved = time.perf_counter()
+            batch_chunks = rerank_batch(questions, batch_chunks)
+            logging.info(f"Batch rerank of {len(questions)} questions took {time.perf_counter() - retrieved:.2f}s")
+        logging.info(f"Batch retrieval took {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        logging.error(f"Batch retrieval error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    def generate():
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {
+                pool.submit(answer_with_timings, q, chunks, allow_fallback): i
+                for i, (q, chunks) in enumerate(zip(questions, batch_chunks))
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    result = future.result()
+                except LLMBusy as e:
+                    result = {"question": questions[i], "error": str(e), "retry_after": e.retry_after}
+                except Exception as e:
+                    logging.error(f"Batch query error: {e}")
+                    result = {"question": questions[i], "error": str(e)}
+                yield json.dumps({"index": i, **result}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/ask/stream", methods=["GET", "POST"])
+def ask_stream():
+    """
+    Same as /ask, streamed as Server-Sent Events:
+    `sources` (retrieved chunks), then `token`/`reasoning` deltas,
+    then `done` with the full answer and cited sources (or `error`).
+    """
+    user_question, options = parse_question()
+    if options is None:
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    if not isinstance(user_question, str) or not user_question:
+        return jsonify({"error": "No question provided"}), 400
+    if options_error(options):
+        return jsonify({"error": options_error(options)}), 400
+
+    logging.info(f"Received streaming question: {user_question} options: {options} ")
+
+    start_time = g.start_time
+
+    def generate():
+        try:
+            with collect_timings() as timings:
+                cached, q_emb, q_model, version = lookup_cached_answer(user_question, options)
+                if cached is None:
+                    candidates = retrieve_candidates(
+                        user_question, q_emb, q_model, options["mode"], options["docs"]
+                    )
+                    context_chunks, prompt, prompt_tokens = build_prompt(
+                        user_question, candidates, options["allow_fallback"]
+                    )
+            if cached is not None:
+                yield sse_event("sources", cached["sources"])
+                yield sse_event("token", {"content": cached["answer"]})
+                yield sse_event("done", {**cached, "timings": {**timings, "total": time.perf_counter() - start_time}})
+                return
+
+            yield sse_event("sources", format_sources("", context_chunks))
+
+            answer_parts, reasoning_parts = [], []
+            start = time.perf_counter()
+            # Collect the LLM queue wait, which happens on the first step of the stream
+            for kind, text in iter_collecting(stream_llm(prompt), timings):
+                if kind == "content":
+                    if not answer_parts:
+                        timings["first_token"] = time.perf_counter() - start_time
+                    answer_parts.append(text)
+                    yield sse_event("token", {"content": text})
+                else:
+                    reasoning_parts.append(text)
+                    yield sse_event("reasoning", {"content": text})
+            timings["llm"] = time.perf_counter() - start
+            observe("llm", timings["llm"])
+
+            answer = "".join(answer_parts)
+            result = {
+                "question": user_question,
+                "answer": answer,
+                "reasoning": "".join(reasoning_parts),
+                "sources": format_sources(answer, context_chunks),
+                "prompt_tokens": prompt_tokens,
+                "timings": {**timings, "total": time.perf_counter() - start_time},
+            }
+            answer_cache.put(user_question, cache_variant(options), q_emb, result, version)
+            yield sse_event("done", {**result, "cached": False})
+        except LLMBusy as e:
+            # Headers are already sent, so the status travels in the event
+            logging.warning(f"LLM busy: {e}")
+            yield sse_event("error", {"error": str(e), "status": e.status, "retry_after": e.retry_after})
+        except Exception as e:
+            logging.error(f"Streaming query error: {e}")
+            yield sse_event("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/docs", methods=["POST"])
@@ -146,45 +468,92 @@ def upload():
     file_path = os.path.join(DATA_DIR, filename)
     file.save(file_path)
 
-    # Extract text
-    if filename.lower().endswith(".pdf"):
-        text = extract_text_from_pdf(file_path)
-    elif filename.lower().endswith(".docx"):
-        text = extract_text_from_docx(file_path)
-    else:
-        return jsonify({"error": "Unsupported file type"}), 400
+    # Extract, chunk, embed and index in the background
+    job = job_queue.submit("ingest", INGEST_STAGES, ingest_file, file_path, filename, meta={"filename": filename})
 
-    # Chunk text
-    chunks = list(chunk_text(text, CHUNK_SIZE))
-    if not chunks:
-        return jsonify({"error": "No text extracted from file"}), 400
+    message = f"File '{filename}' uploaded; ingestion queued as job {job.id}."
+    logging.info(message)
+    return jsonify({
+        "message": message,
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+    }), 202
+
+
+@app.route("/docs/bulk", methods=["POST"])
+def upload_bulk():
+    files = [f for f in request.files.getlist("files") if f.filename]
+    if not files:
+        return jsonify({"error": "No files provided"}), 400
 
-    # Save to DB
-    add_doc(filename, chunks)
+    rejected = [f.filename for f in files if not allowed_file(f.filename)]
+    if rejected:
+        return jsonify({"error": "Unsupported file type", "files": rejected}), 400
 
-    # Rebuild index
-    rebuild_index()
+    file_paths = []
+    for file in files:
+        file_path = os.path.join(DATA_DIR, secure_filename(file.filename))
+        file.save(file_path)
+        file_paths.append(file_path)
 
-    message = f"File '{filename}' uploaded and index updated successfully."
+    # One job for the whole set so the index is only updated once
+    job = job_queue.submit("bulk_ingest", BULK_INGEST_STAGES, ingest_files, file_paths)
+
+    message = f"{len(file_paths)} files uploaded; ingestion queued as job {job.id}."
     logging.info(message)
-    print(message)
     return jsonify({
         "message": message,
-        "chunks_added": len(chunks),
-    })
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+    }), 202
 
 
 @app.route("/docs", methods=["GET"])
 def list_all():
-    docs = list_docs()
-    return jsonify(docs)
+    """
+    The doc list, tagged with the corpus version as its ETag so clients can poll
+    with If-None-Match and get an empty 304 until something is uploaded or removed.
+    With ?limit= (and ?offset=) returns one page as {"docs", "total", "next_offset"}.
+    """
+    limit = request.args.get("limit", type=int)
+    offset = request.args.get("offset", type=int)
+    if limit is None and "limit" in request.args:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if offset is None and "offset" in request.args:
+        return jsonify({"error": "offset must be an integer"}), 400
+    offset = offset or 0
+    if limit is not None and not 1 <= limit <= DOCS_PAGE_MAX:
+        return jsonify({"error": f"limit must be between 1 and {DOCS_PAGE_MAX}"}), 400
+    if offset < 0:
+        return jsonify({"error": "offset must not be negative"}), 400
+
+    # Read before the docs: a write in between makes the list newer than its tag, never older
+    version = corpus_version()
+    # Each page is its own representation
+    etag = str(version) if limit is None else f"{version}-{limit}-{offset}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif limit is None:
+        response = jsonify(list_docs())
+    else:
+        docs, total = list_docs(limit, offset), count_docs()
+        next_offset = offset + limit if offset + limit < total else None
+        response = jsonify({
+            "docs": docs, "total": total, "offset": offset, "next_offset": next_offset, "version": version,
+        })
+    response.set_etag(etag)  # strong and quoted
+    response.headers["Cache-Control"] = "no-cache"  # always revalidate
+    return response
 
 
 @app.route("/docs/<filename>", methods=["DELETE"])
 def remove(filename):
-    remove_doc(filename)
-    rebuild_index()
-    return jsonify({"message": f"File '{filename}' removed and index rebuilt."}), 200
+    chunk_ids = remove_doc(filename)
+    if not remove_from_index(chunk_ids):
+        # Index type cannot delete in place
+        rebuild_index()
+    invalidate_answers()
+    return jsonify({"message": f"File '{filename}' removed and index updated."}), 200
 
 
 @app.route("/docs/reset", methods=["POST"])
@@ -195,11 +564,63 @@ def reset():
         path = os.path.join(DATA_DIR, f)
         if os.path.isfile(path):
             os.remove(path)
-    # Rebuild an empty index
-    rebuild_index()
+    # Stop serving the index; queries already running finish on it
+    delete_index()
+    invalidate_answers()
 
     return jsonify({"message": "All docs, chunks, and index reset."}), 200
 
 
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(status)
+
+
+@app.route("/index/rebuild", methods=["POST"])
+def rebuild():
+    """
+    Re-embed every chunk into a new index generation in the background, with
+    {"model": ...} or EMBEDDING_MODEL; the current one serves until it is published.
+    """
+    model = (request.get_json(silent=True) or {}).get("model") or model_id()
+    if not isinstance(model, str):
+        return jsonify({"error": "'model' must be a string"}), 400
+    job = job_queue.submit("reindex", REINDEX_STAGES, reindex, model, meta={"model": model})
+
+    message = f"Index rebuild with {model} queued as job {job.id}."
+    logging.info(message)
+    return jsonify({
+        "message": message,
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+    }), 202
+
+
+@app.route("/index/stats", methods=["GET"])
+def index_stats():
+    generation, index = retriever.current()
+    return jsonify({
+        "vectors": index.ntotal if index is not None else 0,
+        "generation": generation["id"] if generation is not None else None,
+        "model": generation["model"] if generation is not None else None,
+        "configured_model": model_id(),
+        "generations_on_disk": len(list_generations()),
+        "embedding_cache": get_cache_stats(),
+        "query_embedder": query_batcher.stats(),
+        "answer_cache": answer_cache.stats(),
+        "rerank_cache": score_cache.stats(),
+        "llm": llm_client.stats(),
+        "jobs": job_queue.stats(),
+    })
+
+
 if __name__ == "__main__":
+    # The debug reloader also runs this file in a watcher process; only its child serves
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        queue_legacy_rebuild()
+        if WARMUP:
+            start_warm_up()
     app.run(port=8000, debug=True)
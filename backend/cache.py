@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY, RERANK_CACHE_SIZE
+from metrics import CACHE_LOOKUPS
+
+
+def normalize_question(question):
+    return " ".join(question.lower().split())
+
+
+class AnswerCache:
+    """
+    LRU/TTL cache of LLM answers keyed by (normalized question, variant), where
+    the variant is a hashable summary of the request options (allow_fallback, ...).
+    Lookups fall back to the most similar cached question embedding when its
+    cosine similarity is above the configured threshold.
+    Every corpus change must call `invalidate()`; with several server workers,
+    `sync()` picks up changes made by the others.
+    """
+
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, similarity=ANSWER_CACHE_SIMILARITY):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity = similarity
+        self.version = 0
+        self._corpus_stamp = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (created_at, unit embedding, result)
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    def _expired(self, created_at):
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+
+    def get_exact(self, question, variant):
+        key = (normalize_question(question), variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[0]):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self._stats["exact_hits"] += 1
+            return entry[2]
+
+    def get_similar(self, q_emb, variant):
+        """Return (result, similarity) for the closest cached question, or (None, 0.0)."""
+        q = _unit(q_emb)
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if self._expired(e[0])]:
+                del self._entries[key]
+            # Entries encoded by another model (before a generation switch) can't be compared
+            keys = [k for k, e in self._entries.items() if k[1] == variant and e[1].shape == q.shape]
+            if not keys or self.similarity >= 1.0:
+                self._stats["misses"] += 1
+                return None, 0.0
+            sims = np.stack([self._entries[k][1] for k in keys]) @ q
+            best = int(np.argmax(sims))
+            if sims[best] < self.similarity:
+                self._stats["misses"] += 1
+                return None, float(sims[best])
+            self._entries.move_to_end(keys[best])
+            self._stats["semantic_hits"] += 1
+            return self._entries[keys[best]][2], float(sims[best])
+
+    def put(self, question, variant, q_emb, result, version):
+        """Store a result computed against corpus `version`; stale results are dropped."""
+        if self.max_size <= 0:
+            return
+        key = (normalize_question(question), variant)
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = (time.time(), _unit(q_emb), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def sync(self, corpus_stamp):
+        """
+        Invalidate if the corpus changed in another process since the last call.
+        `corpus_stamp` is any value that changes with the corpus (the CURRENT index generation stamp).
+        """
+        with self._lock:
+            if corpus_stamp != self._corpus_stamp:
+                self._corpus_stamp = corpus_stamp
+                self._entries.clear()
+                self.version += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.version += 1
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "version": self.version, **self._stats}
+
+
+class ScoreCache:
+    """
+    LRU cache of cross-encoder scores keyed by (normalized query, chunk id).
+    Chunk ids are never reused, so entries stay valid across corpus changes.
+    """
+
+    def __init__(self, max_size=RERANK_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._scores = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get_many(self, keys):
+        """Return {key: score} for the keys that are cached."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    found[key] = self._scores[key]
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(keys) - len(found)
+        CACHE_LOOKUPS.labels("rerank", "hit").inc(len(found))
+        CACHE_LOOKUPS.labels("rerank", "miss").inc(len(keys) - len(found))
+        return found
+
+    def put_many(self, items):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for key, score in items:
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._scores), **self._stats}
+
+
+def _unit(vec):
+    vec = np.asarray(vec, dtype="float32").ravel()
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+answer_cache = AnswerCache()
+score_cache = ScoreCache()
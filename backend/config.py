@@ -4,18 +4,96 @@ from dotenv import load_dotenv
 # Load .env file if present
 load_dotenv()
 
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def project_path(path):
+    """Resolve a configured path against the project root rather than the working directory."""
+    return os.path.normpath(os.path.join(PROJECT_ROOT, path))  # absolute paths are kept as is
+
+
 LMSTUDIO_API_URL = os.getenv("LMSTUDIO_API_URL", "http://localhost:5000/generate")
 LLM_MODEL = os.getenv("LLM_MODEL", "openai/gpt-oss-20b")
-LLM_MODEL_MAX_TOKENS = os.getenv("LLM_MODEL_MAX_TOKENS", 12000)
+LLM_MODEL_MAX_TOKENS = int(os.getenv("LLM_MODEL_MAX_TOKENS", 12000))
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", 2))            # concurrent generations sent to the model server
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 16))                 # requests allowed to wait for a slot, beyond that 429
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 30))       # seconds to wait for a slot before 503
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 120))                  # read timeout per generation
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", 2))                      # retries on connection errors and 429/502/503/504
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", 0.5))      # base seconds, doubled per attempt, with jitter
 
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 500))  # tokens per chunk
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 50))  # tokens repeated between consecutive chunks
+CHUNK_ENCODING = os.getenv("CHUNK_ENCODING", "cl100k_base")  # tiktoken encoding used to count tokens
+INGEST_BATCH_CHUNKS = int(os.getenv("INGEST_BATCH_CHUNKS", 256))  # chunks stored/embedded per step while streaming a file
+DEDUP_PAGES = os.getenv("DEDUP_PAGES", "True") == "True"  # drop pages that nearly duplicate an indexed page (boilerplate)
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", 0.8))  # word-trigram Jaccard similarity at which pages are duplicates
+DEDUP_MIN_WORDS = int(os.getenv("DEDUP_MIN_WORDS", 30))  # shorter pages/paragraphs are never treated as duplicates
+DEDUP_MIN_DOCS = int(os.getenv("DEDUP_MIN_DOCS", 3))    # other documents that must hold a page before it counts as boilerplate
 TOP_K = int(os.getenv("TOP_K", 5))              # number of chunks to retrieve
 
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", 20))            # chunks retrieved before dedup/MMR picks TOP_K
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 3000))          # token budget for packed context
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", 0.7))         # 1.0 = pure relevance, 0.0 = pure diversity
+CONTEXT_DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", 0.95))  # cosine above which chunks are duplicates
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "False") == "True"               # cross-encoder rerank of retrieved candidates
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 20))                  # candidates scored per query; bounds added latency
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", 256))                 # tokens per (query, chunk) pair
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 32))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", 10000))               # cached (query, chunk id) scores
+
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")           # vector | lexical | hybrid
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 50))       # per-retriever candidates fused in hybrid mode
+RRF_K = int(os.getenv("RRF_K", 60))                               # reciprocal rank fusion constant
+
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", 4))  # parallel LLM calls for /ask/batch
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 1000))
+DOCS_PAGE_MAX = int(os.getenv("DOCS_PAGE_MAX", 1000))  # largest ?limit= accepted by GET /docs
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))  # background ingestion threads
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", 1000))      # finished jobs kept for GET /jobs/<id>
+BULK_EXTRACT_PROCESSES = int(os.getenv("BULK_EXTRACT_PROCESSES", os.cpu_count() or 1))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 256))                # 0 disables the cache
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 3600))                 # seconds, 0 = no expiry
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))  # cosine; 1.0 = exact only
+
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")                   # torch | onnx | openvino (CPU inference runtime)
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")                      # e.g. onnx/model_qint8_avx512_vnni.onnx for int8
+EMBEDDING_QUERY_BATCH = int(os.getenv("EMBEDDING_QUERY_BATCH", 32))             # max concurrent queries encoded together
+EMBEDDING_QUERY_WAIT_MS = float(os.getenv("EMBEDDING_QUERY_WAIT_MS", 2))        # how long a batch waits for more queries
+
+# FAISS index type: flat | ivf_flat | ivf_pq | hnsw
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+INDEX_NLIST = int(os.getenv("INDEX_NLIST", 0))                              # IVF lists, 0 = 4*sqrt(n)
+INDEX_NPROBE = int(os.getenv("INDEX_NPROBE", 16))                           # IVF lists scanned per query
+INDEX_PQ_M = int(os.getenv("INDEX_PQ_M", 48))                               # PQ sub-quantizers (must divide dim)
+INDEX_PQ_BITS = int(os.getenv("INDEX_PQ_BITS", 8))
+INDEX_HNSW_M = int(os.getenv("INDEX_HNSW_M", 32))
+INDEX_HNSW_EF_CONSTRUCTION = int(os.getenv("INDEX_HNSW_EF_CONSTRUCTION", 40))
+INDEX_HNSW_EF_SEARCH = int(os.getenv("INDEX_HNSW_EF_SEARCH", 64))
+INDEX_IVF_TRAIN_THRESHOLD = int(os.getenv("INDEX_IVF_TRAIN_THRESHOLD", 20000))  # stay flat below this
+INDEX_QUANTIZATION = os.getenv("INDEX_QUANTIZATION", "none")                 # none | fp16 | sq8 stored vectors
+INDEX_MMAP = os.getenv("INDEX_MMAP", "False") == "True"                     # memory-map the index for queries
+FILTER_EXACT_MAX = int(os.getenv("FILTER_EXACT_MAX", 10000))                # doc-filtered searches up to this many chunks are scored exactly
+
+WARMUP = os.getenv("WARMUP", "True") == "True"  # load the embedding model and index at startup instead of on first request
+
+# Production server (gunicorn -c gunicorn.conf.py): preloaded app forked into workers
+WEB_BIND = os.getenv("WEB_BIND", "0.0.0.0:8000")
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", 2))
+WEB_THREADS = int(os.getenv("WEB_THREADS", 8))                  # request threads per worker
+WEB_TIMEOUT = int(os.getenv("WEB_TIMEOUT", 180))                # seconds; must cover a full LLM generation
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", max(1, (os.cpu_count() or 1) // WEB_WORKERS)))  # per worker
 
-DATA_DIR = os.getenv("DATA_DIR", "../data/documents")
-EMBEDDING_DIR = os.getenv("EMBEDDING_DIR", "../data/embeddings")
+# Relative to the project root, so `cd backend && gunicorn`, `uv run backend/app.py` and Docker agree
+DATA_DIR = project_path(os.getenv("DATA_DIR", "data/documents"))
+EMBEDDING_DIR = project_path(os.getenv("EMBEDDING_DIR", "data/embeddings"))
 
-DATABASE_FILE = os.getenv("DATABASE_FILE", "../data/metadata.db")
+DATABASE_FILE = project_path(os.getenv("DATABASE_FILE", "data/metadata.db"))
 
 
@@ -0,0 +1,65 @@
+import numpy as np
+
+from config import (
+    TOP_K,
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_MMR_LAMBDA,
+    CONTEXT_DEDUP_SIMILARITY,
+)
+from embeddings import build_embeddings
+from prompt import get_prompt, build_context_text, format_context_entry, count_tokens, count_prompt_tokens
+
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def select_context(candidates, top_k=TOP_K, max_tokens=CONTEXT_MAX_TOKENS,
+                   mmr_lambda=CONTEXT_MMR_LAMBDA, dedup_similarity=CONTEXT_DEDUP_SIMILARITY):
+    """
+    Choose up to `top_k` of the retrieved `candidates` (best first) for the prompt.
+    Chunks are taken in maximal-marginal-relevance order: relevance is the
+    retriever's own ranking (so each retrieval mode keeps its ordering) and
+    redundancy is cosine similarity to chunks already chosen. Near-duplicates
+    are dropped, and chunks that would overflow `max_tokens` are skipped.
+    Returns (chosen chunks, context tokens used).
+    """
+    if not candidates:
+        return [], 0
+
+    # Chunk vectors come from the embedding cache filled at ingestion time
+    vectors = normalize_rows(build_embeddings([c["text"] for c in candidates]))
+    similarity = vectors @ vectors.T
+    n = len(candidates)
+    relevance = 1.0 - np.arange(n) / n
+
+    chosen, used_tokens = [], 0
+    remaining = list(range(n))
+    while remaining and len(chosen) < top_k:
+        if chosen:
+            redundancy = similarity[np.ix_(remaining, chosen)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        best = remaining.pop(int(np.argmax(scores)))
+
+        if chosen and similarity[best, chosen].max() >= dedup_similarity:
+            continue
+        tokens = count_tokens(format_context_entry(candidates[best], len(chosen))) + 2  # "\n\n" separator
+        if used_tokens + tokens > max_tokens:
+            continue
+        chosen.append(best)
+        used_tokens += tokens
+
+    return [candidates[i] for i in chosen], used_tokens
+
+
+def pack_prompt(user_question, candidates, allow_fallback=False, top_k=TOP_K):
+    """
+    Select context for a question and build the LLM prompt.
+    Returns (context chunks, prompt messages, prompt token count).
+    """
+    context_chunks, _ = select_context(candidates, top_k)
+    prompt = get_prompt(user_question, build_context_text(context_chunks), allow_fallback=allow_fallback)
+    return context_chunks, prompt, count_prompt_tokens(prompt)
@@ -1,15 +1,54 @@
-import sqlite3
 import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
 from config import DATABASE_FILE
+from metrics import timed
+
+_local = threading.local()
+
+
+def get_conn():
+    """
+    This thread's connection, opened on first use and reused afterwards.
+    Connections are never shared across threads or forked processes.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        # Autocommit; writes go through transaction()
+        conn = sqlite3.connect(DATABASE_FILE, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA synchronous=NORMAL")  # durable enough with WAL, much faster commits
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+@contextmanager
+def transaction():
+    """Cursor inside a write transaction that commits on success and rolls back on error."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        yield cur
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
 
 def init_db():
-    os.makedirs("data", exist_ok=True)
-    conn = sqlite3.connect(DATABASE_FILE)
+    os.makedirs(os.path.dirname(DATABASE_FILE) or ".", exist_ok=True)
+    conn = get_conn()
     cur = conn.cursor()
+    # Readers keep working while ingestion writes
+    cur.execute("PRAGMA journal_mode=WAL")
     cur.execute(
         """CREATE TABLE IF NOT EXISTS docs(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT UNIQUE
+            filename TEXT UNIQUE,
+            content_hash TEXT
         )"""
     )
     cur.execute(
@@ -17,56 +56,404 @@ def init_db():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             doc_id INTEGER,
             text TEXT,
+            page_start INTEGER,
+            page_end INTEGER,
+            pending INTEGER NOT NULL DEFAULT 0,
             FOREIGN KEY(doc_id) REFERENCES docs(id) ON DELETE CASCADE
         )"""
     )
-    conn.commit()
-    conn.close()
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks(doc_id)")
+    # Page ranges, content hashes and staging were added after the first release
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(chunks)")}
+    for column in ("page_start", "page_end"):
+        if column not in columns:
+            cur.execute(f"ALTER TABLE chunks ADD COLUMN {column} INTEGER")
+    if "pending" not in columns:
+        cur.execute("ALTER TABLE chunks ADD COLUMN pending INTEGER NOT NULL DEFAULT 0")
+    if "content_hash" not in {row[1] for row in cur.execute("PRAGMA table_info(docs)")}:
+        cur.execute("ALTER TABLE docs ADD COLUMN content_hash TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_docs_content_hash ON docs(content_hash)")
+    # MinHash signatures of indexed pages, with their LSH bucket keys for near-duplicate lookups
+    cur.execute(
+        """CREATE TABLE IF NOT EXISTS page_fingerprints(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            doc_id INTEGER,
+            signature BLOB,
+            FOREIGN KEY(doc_id) REFERENCES docs(id) ON DELETE CASCADE
+        )"""
+    )
+    cur.execute(
+        """CREATE TABLE IF NOT EXISTS page_fingerprint_bands(
+            band INTEGER,
+            fingerprint_id INTEGER,
+            FOREIGN KEY(fingerprint_id) REFERENCES page_fingerprints(id) ON DELETE CASCADE
+        )"""
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_page_fingerprint_bands_band ON page_fingerprint_bands(band)")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_page_fingerprint_bands_fingerprint_id ON page_fingerprint_bands(fingerprint_id)"
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_page_fingerprints_doc_id ON page_fingerprints(doc_id)")
+    if cur.execute("PRAGMA user_version").fetchone()[0] < 1:
+        # Versions that did not enforce foreign keys left the chunks of deleted docs behind;
+        # drop them before the FTS table or any index rebuild picks them up
+        cur.execute("DELETE FROM chunks WHERE NOT EXISTS (SELECT 1 FROM docs WHERE docs.id=chunks.doc_id)")
+        cur.execute("PRAGMA user_version = 1")
+    # Full-text index over committed chunk text, kept in sync with `chunks` by triggers.
+    # Recreated on every start so databases keep up with changes to the trigger bodies.
+    has_fts = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='chunks_fts'"
+    ).fetchone()
+    cur.execute(
+        """CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+            text, content='chunks', content_rowid='id'
+        )"""
+    )
+    for trigger in ("chunks_fts_insert", "chunks_fts_delete", "chunks_fts_update"):
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cur.execute(
+        """CREATE TRIGGER chunks_fts_insert AFTER INSERT ON chunks WHEN new.pending = 0 BEGIN
+            INSERT INTO chunks_fts(rowid, text) VALUES (new.id, new.text);
+        END"""
+    )
+    cur.execute(
+        """CREATE TRIGGER chunks_fts_delete AFTER DELETE ON chunks WHEN old.pending = 0 BEGIN
+            INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        END"""
+    )
+    cur.execute(
+        """CREATE TRIGGER chunks_fts_update AFTER UPDATE ON chunks BEGIN
+            INSERT INTO chunks_fts(chunks_fts, rowid, text) SELECT 'delete', old.id, old.text WHERE old.pending = 0;
+            INSERT INTO chunks_fts(rowid, text) SELECT new.id, new.text WHERE new.pending = 0;
+        END"""
+    )
+    if not has_fts:
+        # Index chunks stored before the FTS table existed
+        cur.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')")
+    # Embedding cache, keyed by content so it survives resets and re-uploads
+    cur.execute(
+        """CREATE TABLE IF NOT EXISTS embeddings(
+            model TEXT,
+            text_hash TEXT,
+            vector BLOB,
+            PRIMARY KEY(model, text_hash)
+        )"""
+    )
+    # Job status, shared by all server worker processes
+    cur.execute(
+        """CREATE TABLE IF NOT EXISTS jobs(
+            id TEXT PRIMARY KEY,
+            data TEXT,
+            updated_at REAL
+        )"""
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_updated_at ON jobs(updated_at)")
+    # Bumped by every write to docs or chunks; never reset, so clients can use it as an ETag
+    cur.execute(
+        """CREATE TABLE IF NOT EXISTS corpus_version(
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )"""
+    )
+    cur.execute("INSERT OR IGNORE INTO corpus_version(id, version) VALUES (1, 0)")
 
 
-def add_doc(filename, chunks):
-    conn = sqlite3.connect(DATABASE_FILE)
-    cur = conn.cursor()
-    cur.execute("INSERT OR IGNORE INTO docs(filename) VALUES (?)", (filename,))
-    doc_id = cur.execute(
-        "SELECT id FROM docs WHERE filename=?", (filename,)
-    ).fetchone()[0]
+def bump_corpus_version(cur):
+    """Mark the corpus as changed, inside the writing transaction."""
+    cur.execute("UPDATE corpus_version SET version = version + 1 WHERE id = 1")
+
+
+def corpus_version():
+    """Version of the doc and chunk tables; only ever increases."""
+    return get_conn().execute("SELECT version FROM corpus_version WHERE id = 1").fetchone()[0]
+
+
+def add_doc(filename, chunks, pending=False):
+    """
+    Append chunks to a doc (created if needed) and return their ids.
+    Chunks are plain strings or {"text", "page_start", "page_end"} dicts.
+    `pending` chunks stay out of search, listings and counts until commit_doc
+    publishes them.
+    """
+    rows = []
     for c in chunks:
-        cur.execute("INSERT INTO chunks(doc_id, text) VALUES (?, ?)", (doc_id, c))
-    conn.commit()
-    conn.close()
+        if isinstance(c, str):
+            c = {"text": c}
+        rows.append((c["text"], c.get("page_start"), c.get("page_end")))
+
+    with transaction() as cur:
+        cur.execute("INSERT OR IGNORE INTO docs(filename) VALUES (?)", (filename,))
+        doc_id = cur.execute(
+            "SELECT id FROM docs WHERE filename=?", (filename,)
+        ).fetchone()[0]
+        if not pending:
+            bump_corpus_version(cur)
+        if not rows:
+            return []
+        cur.executemany(
+            "INSERT INTO chunks(doc_id, text, page_start, page_end, pending) VALUES (?, ?, ?, ?, ?)",
+            [(doc_id, *r, int(pending)) for r in rows],
+        )
+        # The write lock is held for the whole transaction, so the new ids are consecutive
+        last_id = cur.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return list(range(last_id - len(rows) + 1, last_id + 1))
 
 
 def remove_doc(filename):
-    conn = sqlite3.connect(DATABASE_FILE)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM docs WHERE filename=?", (filename,))
-    conn.commit()
-    conn.close()
+    """Delete a doc (its chunks cascade), returning the removed chunk ids."""
+    with transaction() as cur:
+        rows = cur.execute(
+            "SELECT c.id FROM chunks c JOIN docs d ON c.doc_id=d.id WHERE d.filename=?",
+            (filename,),
+        ).fetchall()
+        if cur.execute("DELETE FROM docs WHERE filename=?", (filename,)).rowcount:
+            bump_corpus_version(cur)
+    return [r[0] for r in rows]
 
 
-def list_docs():
-    conn = sqlite3.connect(DATABASE_FILE)
-    cur = conn.cursor()
-    rows = cur.execute("SELECT id, filename FROM docs").fetchall()
-    conn.close()
+def remove_chunks(chunk_ids):
+    """Delete specific chunks (committed or pending), and any doc left without chunks."""
+    with transaction() as cur:
+        cur.executemany("DELETE FROM chunks WHERE id=?", [(i,) for i in chunk_ids])
+        cur.execute("DELETE FROM docs WHERE NOT EXISTS (SELECT 1 FROM chunks WHERE chunks.doc_id=docs.id)")
+        bump_corpus_version(cur)
+
+
+def commit_doc(filename, content_hash, fingerprints=(), superseded_ids=(), chunk_ids=()):
+    """
+    Finish ingesting a doc in one transaction: publish its pending `chunk_ids`,
+    delete the chunks of the version it replaces and store its content hash and
+    (signature, band keys) page fingerprints. A doc left without chunks is removed.
+    """
+    with transaction() as cur:
+        cur.executemany("DELETE FROM chunks WHERE id=?", [(i,) for i in superseded_ids])
+        cur.executemany("UPDATE chunks SET pending=0 WHERE id=?", [(i,) for i in chunk_ids])
+        bump_corpus_version(cur)
+        row = cur.execute("SELECT id FROM docs WHERE filename=?", (filename,)).fetchone()
+        if row is None:
+            return
+        doc_id = row[0]
+        if not cur.execute("SELECT 1 FROM chunks WHERE doc_id=? AND pending=0 LIMIT 1", (doc_id,)).fetchone():
+            cur.execute("DELETE FROM docs WHERE id=?", (doc_id,))
+            return
+        cur.execute("UPDATE docs SET content_hash=? WHERE id=?", (content_hash, doc_id))
+        cur.execute("DELETE FROM page_fingerprints WHERE doc_id=?", (doc_id,))
+        for signature, bands in fingerprints:
+            cur.execute("INSERT INTO page_fingerprints(doc_id, signature) VALUES (?, ?)", (doc_id, signature))
+            fingerprint_id = cur.lastrowid
+            cur.executemany(
+                "INSERT INTO page_fingerprint_bands(band, fingerprint_id) VALUES (?, ?)",
+                [(band, fingerprint_id) for band in bands],
+            )
+
+
+def find_doc_by_hash(content_hash):
+    """Filename of an indexed doc with this content hash, or None."""
+    row = get_conn().execute("SELECT filename FROM docs WHERE content_hash=? LIMIT 1", (content_hash,)).fetchone()
+    return row[0] if row else None
+
+
+def find_fingerprints(bands, exclude_doc=None):
+    """(filename, signature) of pages in any of the `bands` buckets, except pages of doc `exclude_doc`."""
+    placeholders = ",".join("?" * len(bands))
+    rows = get_conn().execute(
+        f"SELECT DISTINCT p.id, d.filename, p.signature FROM page_fingerprint_bands b "
+        f"JOIN page_fingerprints p ON b.fingerprint_id=p.id JOIN docs d ON p.doc_id=d.id "
+        f"WHERE b.band IN ({placeholders}) AND d.filename IS NOT ?",
+        (*bands, exclude_doc),
+    ).fetchall()
+    return [(r[1], r[2]) for r in rows]
+
+
+# Docs still being ingested for the first time have only pending chunks
+COMMITTED_DOC = "EXISTS (SELECT 1 FROM chunks WHERE chunks.doc_id=docs.id AND chunks.pending=0)"
+
+
+def list_docs(limit=None, offset=0):
+    """Docs in upload order; `limit` and `offset` select one page."""
+    rows = get_conn().execute(
+        f"SELECT id, filename FROM docs WHERE {COMMITTED_DOC} ORDER BY id LIMIT ? OFFSET ?",
+        (-1 if limit is None else limit, offset),
+    ).fetchall()
     return [{"id": r[0], "filename": r[1]} for r in rows]
 
 
+def count_docs():
+    return get_conn().execute(f"SELECT COUNT(*) FROM docs WHERE {COMMITTED_DOC}").fetchone()[0]
+
+
+def chunk_row(r):
+    return {"id": r[0], "text": r[1], "source": r[2], "page_start": r[3], "page_end": r[4]}
+
+
 def get_all_chunks():
-    conn = sqlite3.connect(DATABASE_FILE)
-    cur = conn.cursor()
-    rows = cur.execute(
-        "SELECT c.text, d.filename FROM chunks c JOIN docs d ON c.doc_id=d.id"
-    ).fetchall()
-    conn.close()
-    return [{"text": r[0], "source": r[1]} for r in rows]
+    with timed("chunk_load_all"):
+        rows = get_conn().execute(
+            "SELECT c.id, c.text, d.filename, c.page_start, c.page_end FROM chunks c JOIN docs d ON c.doc_id=d.id "
+            "WHERE c.pending=0"
+        ).fetchall()
+    return [chunk_row(r) for r in rows]
+
+
+def iter_chunk_texts(batch_size):
+    """Yield [(id, text)] batches of every committed chunk in id order, without loading the corpus at once."""
+    last_id = 0
+    while True:
+        rows = get_conn().execute(
+            "SELECT id, text FROM chunks WHERE id > ? AND pending=0 ORDER BY id LIMIT ?", (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def get_chunk_texts(chunk_ids, batch_size=500):
+    """{id: text} of the requested chunks that exist, pending ones included."""
+    texts = {}
+    for start in range(0, len(chunk_ids), batch_size):
+        batch = [int(i) for i in chunk_ids[start:start + batch_size]]
+        placeholders = ",".join("?" * len(batch))
+        texts.update(get_conn().execute(f"SELECT id, text FROM chunks WHERE id IN ({placeholders})", batch))
+    return texts
+
+
+def get_chunk_ids():
+    """Ids of every committed chunk, ascending."""
+    return [r[0] for r in get_conn().execute("SELECT id FROM chunks WHERE pending=0 ORDER BY id")]
+
+
+def get_chunks_by_ids(chunk_ids):
+    """Fetch only the requested chunks, returned as {id: chunk}."""
+    if not chunk_ids:
+        return {}
+    placeholders = ",".join("?" * len(chunk_ids))
+    with timed("chunk_fetch"):
+        rows = get_conn().execute(
+            f"SELECT c.id, c.text, d.filename, c.page_start, c.page_end FROM chunks c JOIN docs d ON c.doc_id=d.id "
+            f"WHERE c.id IN ({placeholders})",
+            list(chunk_ids),
+        ).fetchall()
+    return {r[0]: chunk_row(r) for r in rows}
+
+
+def get_doc_chunk_ids(filenames):
+    """Ids of every committed chunk of the given docs."""
+    if not filenames:
+        return []
+    placeholders = ",".join("?" * len(filenames))
+    with timed("doc_filter"):
+        rows = get_conn().execute(
+            f"SELECT c.id FROM chunks c JOIN docs d ON c.doc_id=d.id "
+            f"WHERE d.filename IN ({placeholders}) AND c.pending=0",
+            list(filenames),
+        ).fetchall()
+    return [r[0] for r in rows]
+
+
+def search_chunks_fts(match_query, limit, filenames=None):
+    """
+    BM25 search over chunk text, optionally only in the given docs.
+    Returns [(chunk_id, bm25)], best (lowest) first.
+    """
+    sql = "SELECT rowid, bm25(chunks_fts) FROM chunks_fts WHERE chunks_fts MATCH ?"
+    args = [match_query]
+    if filenames is not None:
+        if not filenames:
+            return []
+        placeholders = ",".join("?" * len(filenames))
+        sql += (
+            " AND rowid IN (SELECT c.id FROM chunks c JOIN docs d ON c.doc_id=d.id "
+            f"WHERE d.filename IN ({placeholders}))"
+        )
+        args += list(filenames)
+    with timed("fts_search"):
+        return get_conn().execute(sql + " ORDER BY bm25(chunks_fts) LIMIT ?", (*args, limit)).fetchall()
+
+
+def count_chunks():
+    return get_conn().execute(
+        "SELECT COUNT(*) FROM chunks c JOIN docs d ON c.doc_id=d.id WHERE c.pending=0"
+    ).fetchone()[0]
 
 
 def reset_db():
-    conn = sqlite3.connect(DATABASE_FILE)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM chunks")
-    cur.execute("DELETE FROM docs")
-    conn.commit()
-    conn.close()
+    with transaction() as cur:
+        cur.execute("DELETE FROM docs")
+        cur.execute("DELETE FROM chunks")  # orphans left by versions without foreign keys
+        bump_corpus_version(cur)
+
+
+def cleanup_db(vacuum=False):
+    """
+    Remove chunks whose doc no longer exists (init_db already drops those left
+    by versions that did not enforce foreign keys), pending chunks left by an
+    interrupted ingestion and docs without chunks, then optimize the FTS index.
+    Run it while no ingestion is in progress. With `vacuum=True` also checkpoint the WAL and compact the file.
+    Returns the removed orphan chunk ids and the pending chunk and doc counts.
+    """
+    with transaction() as cur:
+        orphans = [r[0] for r in cur.execute(
+            "SELECT id FROM chunks WHERE NOT EXISTS (SELECT 1 FROM docs WHERE docs.id=chunks.doc_id)"
+        )]
+        cur.executemany("DELETE FROM chunks WHERE id=?", [(i,) for i in orphans])
+        # Never added to the index, so only the rows go
+        pending = cur.execute("DELETE FROM chunks WHERE pending=1").rowcount
+        empty_docs = cur.execute(
+            "DELETE FROM docs WHERE NOT EXISTS (SELECT 1 FROM chunks WHERE chunks.doc_id=docs.id)"
+        ).rowcount
+        if orphans or empty_docs:
+            bump_corpus_version(cur)
+        cur.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('optimize')")
+    if vacuum:
+        conn = get_conn()
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return {"orphan_chunks": orphans, "pending_chunks": pending, "empty_docs": empty_docs}
+
+
+def get_cached_embeddings(model, text_hashes, batch_size=500):
+    """Return {text_hash: vector bytes} for the hashes already cached."""
+    conn = get_conn()
+    found = {}
+    for i in range(0, len(text_hashes), batch_size):
+        batch = text_hashes[i:i + batch_size]
+        placeholders = ",".join("?" * len(batch))
+        rows = conn.execute(
+            f"SELECT text_hash, vector FROM embeddings WHERE model=? AND text_hash IN ({placeholders})",
+            (model, *batch),
+        ).fetchall()
+        found.update(rows)
+    return found
+
+
+def save_cached_embeddings(model, items):
+    """Store (text_hash, vector bytes) pairs for a model."""
+    with transaction() as cur:
+        cur.executemany(
+            "INSERT OR REPLACE INTO embeddings(model, text_hash, vector) VALUES (?, ?, ?)",
+            [(model, h, v) for h, v in items],
+        )
+
+
+def save_job(job_id, data, updated_at):
+    """Upsert a job's JSON status."""
+    with transaction() as cur:
+        cur.execute(
+            "INSERT OR REPLACE INTO jobs(id, data, updated_at) VALUES (?, ?, ?)",
+            (job_id, data, updated_at),
+        )
+
+
+def get_job(job_id):
+    row = get_conn().execute("SELECT data FROM jobs WHERE id=?", (job_id,)).fetchone()
+    return row[0] if row else None
+
+
+def prune_jobs(keep):
+    """Keep only the `keep` most recently updated jobs."""
+    with transaction() as cur:
+        cur.execute(
+            "DELETE FROM jobs WHERE id NOT IN (SELECT id FROM jobs ORDER BY updated_at DESC LIMIT ?)",
+            (keep,),
+        )
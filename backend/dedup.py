@@ -0,0 +1,130 @@
+"""
+Duplicate detection for ingestion.
+
+Files are fingerprinted by SHA-256 so unchanged re-uploads and copies under
+another name are skipped before parsing. Pages (paragraphs for DOCX) get a
+MinHash signature over their word trigrams. A page whose estimated Jaccard
+similarity to another page is at least DEDUP_SIMILARITY is dropped before
+chunking when it repeats a page of the same document, or when DEDUP_MIN_DOCS
+other documents already hold it: boilerplate (cover sheets, disclaimers) is
+stored a few times rather than once per report, and stays indexed when one of
+the documents holding it is deleted. Candidates are found through LSH band
+buckets, so a lookup only touches pages that are likely similar.
+"""
+import hashlib
+import re
+
+import numpy as np
+
+from config import DEDUP_PAGES, DEDUP_SIMILARITY, DEDUP_MIN_WORDS, DEDUP_MIN_DOCS
+from db import find_doc_by_hash, find_fingerprints
+from metrics import INGEST_SKIPPED
+
+SHINGLE_WORDS = 3
+NUM_PERM = 64
+BANDS = 16  # of NUM_PERM // BANDS rows; pages with Jaccard >= 0.8 share a band with probability > 0.999
+PRIME = (1 << 32) + 15
+_rng = np.random.default_rng(20240601)  # fixed: signatures are stored and compared across runs
+PERM_A = _rng.integers(1, PRIME, NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.integers(0, PRIME, NUM_PERM, dtype=np.uint64)
+
+
+def file_hash(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            h.update(block)
+    return h.hexdigest()
+
+
+def skip_reason(filename, content_hash):
+    """Why an upload needs no ingestion ({"skipped", "duplicate_of"}), or None."""
+    existing = find_doc_by_hash(content_hash)
+    if existing is None:
+        return None
+    if existing == filename:
+        INGEST_SKIPPED.labels("unchanged_file").inc()
+        return {"skipped": "unchanged"}
+    INGEST_SKIPPED.labels("duplicate_file").inc()
+    return {"skipped": "duplicate", "duplicate_of": existing}
+
+
+def minhash(words):
+    """MinHash signature (uint32[NUM_PERM]) of a word list, or None when it is too short to compare."""
+    if len(words) < max(DEDUP_MIN_WORDS, SHINGLE_WORDS):
+        return None
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    x = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little") for s in shingles),
+        dtype=np.uint64, count=len(shingles),
+    )
+    # (a * x + b) mod p for every permutation; a, x < 2^32 so this fits in 64 bits
+    return ((np.outer(x, PERM_A) + PERM_B) % PRIME).min(axis=0).astype(np.uint32)
+
+
+def page_signature(text):
+    """Signature of a page's text, or None when page dedup is off or the page is short."""
+    return minhash(re.findall(r"\w+", text.lower())) if DEDUP_PAGES else None
+
+
+def band_keys(signature):
+    """LSH bucket keys: one 63-bit hash per band of rows."""
+    rows = signature.reshape(BANDS, -1)
+    return [
+        int.from_bytes(hashlib.blake2b(bytes([i]) + band.tobytes(), digest_size=8).digest(), "little") >> 1
+        for i, band in enumerate(rows)
+    ]
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(a == b))
+
+
+class PageFilter:
+    """
+    Drops near-duplicate pages across one ingestion job (one file or a bulk set).
+    Pages of a doc are not compared against its own previous version.
+    """
+
+    def __init__(self):
+        self._seen = {}  # band key -> (doc, signature) of pages kept earlier in this job
+        self.pages_skipped = 0
+
+    def is_duplicate(self, signature, keys, doc):
+        """Whether the page repeats a page of `doc` or one held by DEDUP_MIN_DOCS other docs."""
+        holders = set()
+        for key in keys:
+            for other_doc, other in self._seen.get(key, ()):
+                if similarity(signature, other) >= DEDUP_SIMILARITY:
+                    if other_doc == doc:
+                        return True
+                    holders.add(other_doc)
+        for other_doc, other in find_fingerprints(keys, exclude_doc=doc):
+            if other_doc not in holders and similarity(signature, np.frombuffer(other, dtype=np.uint32)) >= DEDUP_SIMILARITY:
+                holders.add(other_doc)
+        return len(holders) >= DEDUP_MIN_DOCS
+
+    def keep(self, signature, fingerprints, doc):
+        """
+        False when `signature` nearly duplicates a page of `doc` or boilerplate held
+        by other docs. Otherwise remember it, append its (signature bytes, band keys)
+        to `fingerprints` (stored with the doc) and return True.
+        """
+        if signature is None:
+            return True
+        keys = band_keys(signature)
+        if self.is_duplicate(signature, keys, doc):
+            self.pages_skipped += 1
+            INGEST_SKIPPED.labels("near_duplicate_page").inc()
+            return False
+        for key in keys:
+            self._seen.setdefault(key, []).append((doc, signature))
+        fingerprints.append((signature.tobytes(), keys))
+        return True
+
+    def filter(self, pages, fingerprints, doc):
+        """Yield the (page, text) pairs of `doc` that are not near-duplicates."""
+        for page, text in pages:
+            if self.keep(page_signature(text), fingerprints, doc):
+                yield page, text
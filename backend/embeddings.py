@@ -1,19 +1,247 @@
-from sentence_transformers import SentenceTransformer
-
-# Load your embedding model once
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"  # light weight
-model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-
-# Build FAISS index from chunks
-def build_embeddings(chunks, embedding_model_name=EMBEDDING_MODEL_NAME):
-    vectors = model.encode(chunks, convert_to_numpy=True, embedding_model_name=embedding_model_name)
-    dim = vectors.shape[1]
-    import faiss
-    index = faiss.IndexFlatL2(dim)
-    index.add(vectors)
-    return index, vectors
-
-# Get embedding for a single query
-def get_embedding(text, embedding_model_name=EMBEDDING_MODEL_NAME):
-    vec = model.encode([text], convert_to_numpy=True, embedding_model_name=embedding_model_name)
-    return vec[0]
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    EMBEDDING_ONNX_FILE,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_QUERY_BATCH,
+    EMBEDDING_QUERY_WAIT_MS,
+)
+from db import get_cached_embeddings, save_cached_embeddings
+from index import current_generation
+from metrics import CACHE_LOOKUPS, EMBED_BATCH_SIZE, observe, timed
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "openvino")
+
+_models = {}  # model id -> SentenceTransformer
+_model_lock = threading.Lock()
+
+# Embedding cache hit/miss counters
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def model_id():
+    """
+    Name the configured model's vectors are stored under. A quantised/exported
+    backend produces slightly different vectors, so it gets its own cache entries.
+    """
+    if EMBEDDING_BACKEND == "torch":
+        return EMBEDDING_MODEL
+    return f"{EMBEDDING_MODEL}@{EMBEDDING_BACKEND}:{EMBEDDING_ONNX_FILE or 'default'}"
+
+
+def active_model():
+    """
+    Model of the index generation being served, which queries and new chunks must
+    be encoded with; the configured one until an index exists. The two differ
+    while a generation built with a newly configured model is still being built.
+    """
+    generation = current_generation()
+    return generation["model"] if generation is not None else model_id()
+
+
+def get_model(name=None):
+    """
+    Load an embedding model (a model_id(); default: active_model()) once, on first use.
+    sentence_transformers (and torch) are only imported here so the app starts fast.
+    """
+    name = name or active_model()
+    model = _models.get(name)
+    if model is None:
+        with _model_lock:
+            model = _models.get(name)
+            if model is None:
+                path, _, runtime = name.partition("@")
+                backend, _, onnx_file = runtime.partition(":")
+                backend = backend or "torch"
+                if backend not in EMBEDDING_BACKENDS:
+                    raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}', expected one of {EMBEDDING_BACKENDS}")
+                from sentence_transformers import SentenceTransformer
+
+                kwargs = {}
+                if backend != "torch":
+                    # e.g. EMBEDDING_ONNX_FILE=onnx/model_qint8_avx512_vnni.onnx for the int8 export
+                    kwargs["backend"] = backend
+                    if onnx_file != "default":
+                        kwargs["model_kwargs"] = {"file_name": onnx_file}
+                logging.info(f"Loading embedding model {name}")
+                model = _models[name] = SentenceTransformer(path, device="cpu", **kwargs)
+    return model
+
+
+def unload_models(keep):
+    """Drop loaded models other than those named in `keep` (after a generation switch)."""
+    with _model_lock:
+        for name in set(_models) - set(keep):
+            logging.info(f"Unloading embedding model {name}")
+            del _models[name]
+
+
+def is_model_loaded():
+    return active_model() in _models
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_cache_stats():
+    with _cache_lock:
+        return dict(_cache_stats)
+
+
+# Encode chunks into float32 vectors for the FAISS index, with `model`
+# (default: active_model()).
+# Vectors are cached by (model, text hash) so a chunk is only ever encoded once.
+def build_embeddings(chunks, model=None):
+    name = model or active_model()
+    hashes = [text_hash(c) for c in chunks]
+    cached = get_cached_embeddings(name, list(set(hashes)))
+
+    # Encode each distinct missing text once
+    missing = {}
+    for h, c in zip(hashes, chunks):
+        if h not in cached and h not in missing:
+            missing[h] = c
+
+    if missing:
+        with timed("embed_chunks"):
+            encoded = get_model(name).encode(
+                list(missing.values()),
+                batch_size=EMBEDDING_BATCH_SIZE,
+                convert_to_numpy=True,
+            ).astype("float32")
+        new_items = [(h, vec.tobytes()) for h, vec in zip(missing, encoded)]
+        save_cached_embeddings(name, new_items)
+        cached.update(new_items)
+
+    with _cache_lock:
+        _cache_stats["hits"] += len(chunks) - len(missing)
+        _cache_stats["misses"] += len(missing)
+    CACHE_LOOKUPS.labels("embedding", "hit").inc(len(chunks) - len(missing))
+    CACHE_LOOKUPS.labels("embedding", "miss").inc(len(missing))
+
+    return np.vstack([np.frombuffer(cached[h], dtype="float32") for h in hashes])
+
+
+# ---------------------------
+# Query embeddings: dynamic micro-batching
+# ---------------------------
+class QueryBatcher:
+    """
+    Encodes query texts on one background thread. Requests that arrive while a
+    batch is running (and, under load, within `max_wait_ms` of the first one) are
+    encoded together in a single forward pass of up to `max_batch` texts, so
+    concurrent /ask handlers don't each run a batch-of-one on contended CPU threads.
+    """
+
+    def __init__(self, max_batch=EMBEDDING_QUERY_BATCH, max_wait_ms=EMBEDDING_QUERY_WAIT_MS):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._stats = {"requests": 0, "batches": 0, "largest_batch": 0, "encode_time": 0.0}
+
+    def _ensure_worker(self):
+        # The worker thread does not survive a fork (gunicorn preload), so each process starts its own
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.SimpleQueue()
+                    threading.Thread(target=self._run, args=(self._queue,), name="query-embedder", daemon=True).start()
+                    self._pid = os.getpid()
+        return self._queue
+
+    def _collect(self, pending, wait):
+        """Block for one request, then take whatever else arrives within `wait` seconds."""
+        batch = [pending.get()]
+        deadline = time.monotonic() + wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(pending.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, pending):
+        last_size = 1
+        while True:
+            # Only hold a batch open under load, so a lone query pays no extra latency
+            batch = self._collect(pending, self.max_wait if last_size > 1 else 0.0)
+            last_size = len(batch)
+            # One forward pass per model (two only while a model switch is being published)
+            texts = {}
+            for text, model, _ in batch:
+                texts.setdefault(model, {})[text] = None
+            start = time.perf_counter()
+            rows = {}
+            try:
+                for model, model_texts in texts.items():
+                    vecs = get_model(model).encode(
+                        list(model_texts), batch_size=len(model_texts), convert_to_numpy=True
+                    ).astype("float32")
+                    rows.update(((model, text), vec) for text, vec in zip(model_texts, vecs))
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start
+            observe("query_encode", elapsed)
+            EMBED_BATCH_SIZE.observe(len(batch))
+            for text, model, future in batch:
+                future.set_result(rows[model, text])
+            with self._lock:
+                self._stats["requests"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+                self._stats["encode_time"] += elapsed
+
+    def submit(self, text, model=None):
+        future = Future()
+        self._ensure_worker().put((text, model or active_model(), future))
+        return future
+
+    def embed(self, texts, model=None):
+        """
+        Encode texts with `model` (default: active_model()), possibly together with
+        other callers' texts; returns a float32 matrix.
+        """
+        model = model or active_model()
+        futures = [self.submit(t, model) for t in texts]
+        return np.vstack([f.result() for f in futures])
+
+    def stats(self):
+        with self._lock:
+            batches = self._stats["batches"]
+            return {
+                **self._stats,
+                "avg_batch": self._stats["requests"] / batches if batches else 0.0,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+
+query_batcher = QueryBatcher()
+
+
+# Get embedding for a single query (with the served model unless `model` is given)
+def get_embedding(text, model=None):
+    with timed("embed"):
+        return query_batcher.embed([text], model)[0]
+
+
+# Get embeddings for many queries (shares batches with concurrent single queries)
+def get_embeddings(texts, model=None):
+    with timed("embed"):
+        return query_batcher.embed(texts, model)
@@ -0,0 +1,80 @@
+"""
+Production server: `cd backend && gunicorn -c gunicorn.conf.py`
+
+The app is imported once in the master (preload_app) and, with WARMUP, the
+embedding model and the FAISS index are loaded before workers fork and are
+shared copy-on-write.
+Workers pick up index changes made by any other worker through the CURRENT
+generation pointer (see retrieval.Retriever and AnswerCache.sync).
+Prometheus metrics are written per process to PROMETHEUS_MULTIPROC_DIR and
+merged by /metrics.
+"""
+import gc
+import glob
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Must be set before prometheus_client is imported (with the preloaded app)
+_own_metrics_dir = "PROMETHEUS_MULTIPROC_DIR" not in os.environ
+if _own_metrics_dir:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="rag-metrics-")
+else:
+    # Counters from a previous run would otherwise be added to this one
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+    for _path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        os.remove(_path)
+
+from config import WEB_BIND, WEB_WORKERS, WEB_THREADS, WEB_TIMEOUT, TORCH_THREADS, WARMUP  # noqa: E402
+
+wsgi_app = "app:app"
+bind = WEB_BIND
+workers = WEB_WORKERS
+worker_class = "gthread"
+threads = WEB_THREADS
+timeout = WEB_TIMEOUT
+preload_app = True
+
+
+def when_ready(server):
+    if WARMUP:
+        from startup import warm_up
+
+        # Load the model and index in the master (not in a thread: workers fork
+        # from here) so every worker starts with them
+        warm_up()
+        server.log.info("Preloaded embedding model and FAISS index")
+        from retrieval import retriever
+
+        # The master serves no queries; its lease would keep a replaced generation on disk for good
+        retriever.release_lease()
+    # Keep the GC from touching (and so copying) preloaded objects in every worker
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Workers share the CPU; don't let each one start a thread per core
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(TORCH_THREADS)
+    retrieval = sys.modules.get("retrieval")
+    if retrieval is not None:
+        retrieval.retriever.renew_lease()
+    startup = sys.modules.get("startup")
+    if startup is not None:
+        startup.queue_legacy_rebuild()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    # Drop the dead worker's live gauges (LLM in-flight/queued)
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    if _own_metrics_dir:
+        shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
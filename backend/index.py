@@ -0,0 +1,579 @@
+import fcntl
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from config import (
+    EMBEDDING_DIR,
+    INDEX_TYPE,
+    INDEX_NLIST,
+    INDEX_NPROBE,
+    INDEX_PQ_M,
+    INDEX_PQ_BITS,
+    INDEX_HNSW_M,
+    INDEX_HNSW_EF_CONSTRUCTION,
+    INDEX_HNSW_EF_SEARCH,
+    INDEX_IVF_TRAIN_THRESHOLD,
+    INDEX_QUANTIZATION,
+    FILTER_EXACT_MAX,
+)
+
+GENERATIONS_DIR = os.path.join(EMBEDDING_DIR, "generations")
+CURRENT_PATH = os.path.join(EMBEDDING_DIR, "CURRENT")  # JSON pointer to the served generation
+LEGACY_INDEX_PATH = os.path.join(EMBEDDING_DIR, "document_index.faiss")  # single-file layout before generations
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# faiss is imported inside the functions that need it, so importing this module stays cheap
+QUANTIZATIONS = {
+    "fp16": "QT_fp16",  # 2x smaller, near-lossless
+    "sq8": "QT_8bit",   # 4x smaller, per-dimension ranges trained on build
+}
+
+
+class IndexLock:
+    """
+    Re-entrant lock around read-modify-write cycles on the index (and around
+    publishing and collecting generations).
+    Holds an flock on a file next to the index as well as a thread lock, so
+    ingestion threads in different server worker processes are serialized too.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            self._fd = os.open(self._path, os.O_CREAT | os.O_RDWR)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+
+index_lock = IndexLock(os.path.join(EMBEDDING_DIR, "index.lock"))
+
+
+def index_kind_for(n_vectors, index_type=INDEX_TYPE, train_threshold=INDEX_IVF_TRAIN_THRESHOLD):
+    """IVF variants need training data, so small corpora stay on a flat index."""
+    if index_type.startswith("ivf") and n_vectors < train_threshold:
+        return "flat"
+    return index_type
+
+
+def index_kind(index):
+    """Which of INDEX_TYPES a loaded index is."""
+    import faiss
+
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexIDMap) and isinstance(faiss.downcast_index(index.index), faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def create_index(vectors, chunk_ids, index_type=INDEX_TYPE, **params):
+    """
+    Build an index of the configured type over `vectors`, keyed by `chunks.id`.
+    IVF indexes carry ids natively; flat and HNSW are wrapped in an IndexIDMap2.
+    Flat, IVF-Flat and HNSW store scalar-quantized vectors when INDEX_QUANTIZATION
+    is set (IVF-PQ is already compressed).
+    `params` override the INDEX_* config values (used by the benchmarks).
+    """
+    import faiss
+
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown INDEX_TYPE '{index_type}', expected one of {INDEX_TYPES}")
+    quantization = params.get("quantization", INDEX_QUANTIZATION)
+    if quantization != "none" and quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown INDEX_QUANTIZATION '{quantization}', expected none, fp16 or sq8")
+    qtype = getattr(faiss.ScalarQuantizer, QUANTIZATIONS[quantization]) if quantization != "none" else None
+
+    n, dim = vectors.shape
+    kind = index_kind_for(n, index_type, params.get("train_threshold", INDEX_IVF_TRAIN_THRESHOLD))
+    ids = np.asarray(chunk_ids, dtype="int64")
+
+    if kind.startswith("ivf"):
+        nlist = params.get("nlist", INDEX_NLIST) or max(1, int(4 * math.sqrt(n)))
+        nlist = min(nlist, n)
+        quantizer = faiss.IndexFlatL2(dim)
+        if kind == "ivf_pq":
+            index = faiss.IndexIVFPQ(
+                quantizer, dim, nlist,
+                params.get("pq_m", INDEX_PQ_M), params.get("pq_bits", INDEX_PQ_BITS),
+            )
+        elif qtype is not None:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, qtype)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        index.train(vectors)
+        index.add_with_ids(vectors, ids)
+    elif kind == "hnsw":
+        hnsw_m = params.get("hnsw_m", INDEX_HNSW_M)
+        if qtype is not None:
+            hnsw = faiss.IndexHNSWSQ(dim, qtype, hnsw_m)
+            hnsw.train(sq_training_set(vectors))
+        else:
+            hnsw = faiss.IndexHNSWFlat(dim, hnsw_m)
+        hnsw.hnsw.efConstruction = params.get("ef_construction", INDEX_HNSW_EF_CONSTRUCTION)
+        index = faiss.IndexIDMap2(hnsw)
+        index.add_with_ids(vectors, ids)
+    else:
+        if qtype is not None:
+            flat = faiss.IndexScalarQuantizer(dim, qtype)
+            flat.train(sq_training_set(vectors))
+        else:
+            flat = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIDMap2(flat)
+        index.add_with_ids(vectors, ids)
+
+    configure_search(index, **params)
+    return index
+
+
+def sq_training_set(vectors):
+    """
+    Scalar quantizer ranges are fixed at training time, and flat/HNSW indexes keep
+    receiving new documents afterwards. Pad the training set with the [-1, 1]
+    bounds of unit-norm embeddings so later vectors are not clipped.
+    """
+    dim = vectors.shape[1]
+    bounds = np.vstack([-np.ones(dim), np.ones(dim)]).astype("float32")
+    return np.vstack([vectors, bounds])
+
+
+def configure_search(index, **params):
+    """Apply query-time knobs (nprobe / efSearch) from config."""
+    import faiss
+
+    kind = index_kind(index)
+    if kind.startswith("ivf"):
+        index.nprobe = params.get("nprobe", INDEX_NPROBE)
+    elif kind == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efSearch = params.get("ef_search", INDEX_HNSW_EF_SEARCH)
+    return index
+
+
+def export_vectors(index):
+    """(vectors, ids) stored in a flat id-mapped index, for re-indexing without re-encoding."""
+    import faiss
+
+    ids = faiss.vector_to_array(index.id_map)
+    return index.index.reconstruct_n(0, index.ntotal), ids
+
+
+def reconstruct_ids(index, ids):
+    """(ids, vectors) of the given chunk ids that are in an id-mapped flat/HNSW index."""
+    try:
+        return ids, index.reconstruct_batch(ids)
+    except RuntimeError:
+        # Some ids are not indexed (yet): keep the ones that are
+        found, vectors = [], []
+        for i in ids:
+            try:
+                vectors.append(index.reconstruct(int(i)))
+                found.append(i)
+            except RuntimeError:
+                pass
+        if not found:
+            return np.empty(0, dtype="int64"), np.empty((0, index.d), dtype="float32")
+        return np.asarray(found, dtype="int64"), np.vstack(vectors)
+
+
+def exact_subset_search(index, q_embs, top_k, ids):
+    """Brute-force search over the reconstructed vectors of `ids`."""
+    import faiss
+
+    ids, vectors = reconstruct_ids(index, ids)
+    distances = np.full((len(q_embs), top_k), np.finfo("float32").max, dtype="float32")
+    found = np.full((len(q_embs), top_k), -1, dtype="int64")
+    k = min(top_k, len(ids))
+    if k == 0:
+        return distances, found
+    distances[:, :k], positions = faiss.knn(np.ascontiguousarray(q_embs, dtype="float32"), vectors, k)
+    found[:, :k] = ids[positions]
+    return distances, found
+
+
+def search_subset(index, q_embs, top_k, chunk_ids, exact_max=FILTER_EXACT_MAX):
+    """
+    Search only among `chunk_ids` (e.g. the chunks of selected documents); returns
+    (distances, ids) like index.search, with min(top_k, len(chunk_ids)) hits per query.
+    On flat and HNSW indexes, subsets of up to `exact_max` chunks are scored exactly
+    from their stored vectors, so the cost follows the subset, not the corpus.
+    Otherwise an IDSelector restricts the index search itself, with nprobe/efSearch
+    scaled up by how small the subset is so that about as many of its members are
+    visited as an unfiltered search would visit. When that still comes back short,
+    IVF is searched again with every list probed and HNSW falls back to exact scoring.
+    """
+    import faiss
+
+    ids = np.unique(np.asarray(list(chunk_ids), dtype="int64"))
+    kind = index_kind(index)
+    if kind in ("flat", "hnsw") and len(ids) <= exact_max:
+        return exact_subset_search(index, q_embs, top_k, ids)
+
+    selector = faiss.IDSelectorBatch(ids)
+    widen = index.ntotal / max(len(ids), 1)
+    if kind.startswith("ivf"):
+        nprobe = min(index.nlist, math.ceil(index.nprobe * widen))
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    elif kind == "hnsw":
+        ef = math.ceil(faiss.downcast_index(index.index).hnsw.efSearch * widen)
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(ef, top_k))
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    distances, found = index.search(q_embs, top_k, params=params)
+
+    if (found[:, :min(top_k, len(ids))] < 0).any():
+        if kind.startswith("ivf") and params.nprobe < index.nlist:
+            params.nprobe = index.nlist
+            distances, found = index.search(q_embs, top_k, params=params)
+        elif kind == "hnsw":
+            distances, found = exact_subset_search(index, q_embs, top_k, ids)
+    return distances, found
+
+
+# ---------------------------
+# Generations
+# ---------------------------
+# Every index write publishes a new generation: a directory with the index,
+# ids.npy (the chunk ids it holds) and meta.json (which embedding model its
+# vectors come from). CURRENT names the generation being served and is replaced
+# atomically, so readers never see a half-written index, and a generation built
+# with another model in the background is swapped in at once.
+def generation_dir(generation_id):
+    return os.path.join(GENERATIONS_DIR, generation_id)
+
+
+def index_path(generation_id=None):
+    """Index file of a generation (default: the current one), or None without one."""
+    if generation_id is None:
+        generation = current_generation()
+        if generation is None:
+            return None
+        generation_id = generation["id"]
+    return os.path.join(generation_dir(generation_id), "index.faiss")
+
+
+def generation_ids(generation_id):
+    """Chunk ids held by a generation's index, without reading the index."""
+    return np.load(os.path.join(generation_dir(generation_id), "ids.npy"))
+
+
+def is_position_mapped(generation):
+    """Whether a generation holds a legacy index that maps vectors by position, not chunk id."""
+    return bool(generation["vectors"]) and not len(generation_ids(generation["id"]))
+
+
+def write_json(path, data):
+    """Write `path` through a temp file and an atomic rename."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class GenerationLease:
+    """
+    Shared flock on `generations/<id>.lease`, held by every process that still
+    needs a generation's files (a memory-mapped index, a build in progress).
+    collect_generations() only deletes a generation whose lease it can lock
+    exclusively, so it waits for its readers to finish with it.
+    """
+
+    def __init__(self, generation_id):
+        self.generation_id = generation_id
+        self._path = os.path.join(GENERATIONS_DIR, f"{generation_id}.lease")
+        self._fd = None
+
+    def create(self):
+        """Lease a new generation; the lease file only appears once it is locked."""
+        os.makedirs(GENERATIONS_DIR, exist_ok=True)
+        tmp_path = self._path + ".tmp"
+        self._fd = os.open(tmp_path, os.O_CREAT | os.O_RDWR)
+        fcntl.flock(self._fd, fcntl.LOCK_SH)
+        os.rename(tmp_path, self._path)
+        os.makedirs(generation_dir(self.generation_id))
+        return self
+
+    def acquire(self):
+        """Lease a published generation; False when it has already been collected."""
+        try:
+            self._fd = os.open(self._path, os.O_RDWR)
+        except FileNotFoundError:
+            return False
+        fcntl.flock(self._fd, fcntl.LOCK_SH)
+        if not os.path.exists(index_path(self.generation_id)):
+            # Collected while we waited for the lock
+            self.release()
+            return False
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)  # drops the flock
+            self._fd = None
+
+
+def new_generation():
+    """Create an empty generation to build into; returns the lease held on it."""
+    generation_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    return GenerationLease(generation_id).create()
+
+
+def index_stamp():
+    """Identity of the CURRENT pointer; changes whenever a generation is published or the index dropped."""
+    try:
+        st = os.stat(CURRENT_PATH)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+_current = (None, None)  # (stamp, CURRENT contents) as last read by this process
+
+
+def current_generation():
+    """The served generation ({id, model, dim, vectors, index_type, ...}), or None."""
+    global _current
+    stamp = index_stamp()
+    if stamp is None:
+        return None
+    if stamp != _current[0]:
+        try:
+            with open(CURRENT_PATH) as f:
+                _current = (stamp, json.load(f))
+        except FileNotFoundError:
+            return None
+    return _current[1]
+
+
+def index_ids(index):
+    """Chunk ids stored in an index."""
+    import faiss
+
+    if isinstance(index, faiss.IndexIVF):
+        invlists = index.invlists
+        lists = [
+            faiss.rev_swig_ptr(invlists.get_ids(i), invlists.list_size(i)).copy()
+            for i in range(index.nlist) if invlists.list_size(i)
+        ]
+        return np.concatenate(lists) if lists else np.empty(0, dtype="int64")
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map)
+    return np.empty(0, dtype="int64")  # legacy index, mapped by position
+
+
+def open_index(mmap=False):
+    """
+    Read the current generation's index. Returns (generation, index, lease); the
+    lease keeps the generation's files from being collected and must be released
+    once the index is dropped. index is None when there is no index, or when it
+    predates chunk-id mapping.
+    With `mmap=True` vector storage stays in the page cache and is shared by every
+    process that maps the file; such an index is read-only and must never be added to.
+    """
+    import faiss
+
+    for _ in range(3):
+        generation = current_generation()
+        if generation is None:
+            return None, None, None
+        lease = GenerationLease(generation["id"])
+        if lease.acquire():
+            break
+        # Replaced and collected since CURRENT was read: read it again
+    else:
+        raise RuntimeError(f"Index generation {generation['id']} is missing from {GENERATIONS_DIR}")
+
+    flags = 0
+    if mmap:
+        flags = faiss.IO_FLAG_MMAP
+        # IVF inverted lists can only be mapped from a file object, not through IFC
+        if not generation.get("index_type", "").startswith("ivf"):
+            flags |= faiss.IO_FLAG_MMAP_IFC
+    index = faiss.read_index(index_path(generation["id"]), flags)
+    if not isinstance(index, (faiss.IndexIDMap, faiss.IndexIVF)):
+        # Indexes written before chunk ids were tracked map by position only
+        logging.warning("FAISS index is not id-mapped and finds nothing until it is rebuilt (queued at startup).")
+        lease.release()
+        return generation, None, None
+    return generation, configure_search(index), lease
+
+
+def load_index(mmap=False):
+    """
+    The current index, for callers that don't keep it around (writers under
+    index_lock, benchmarks). A memory-mapped index that is kept must be opened
+    with open_index and its lease held instead.
+    """
+    _, index, lease = open_index(mmap)
+    if lease is not None:
+        lease.release()
+    return index
+
+
+def publish_index(index, model, lease=None):
+    """
+    Write `index`, whose vectors come from embedding `model`, as a generation and
+    make it current. It goes into the generation held by `lease` (a background
+    build) or a new one. Returns the generation id.
+    """
+    import faiss
+
+    with index_lock:
+        if lease is None:
+            lease = new_generation()
+        try:
+            generation_id = lease.generation_id
+            path = index_path(generation_id)
+            faiss.write_index(index, path)
+            with open(path, "rb") as f:
+                os.fsync(f.fileno())
+            np.save(os.path.join(generation_dir(generation_id), "ids.npy"), index_ids(index))
+            meta = {
+                "id": generation_id,
+                "model": model,
+                "dim": index.d,
+                "vectors": index.ntotal,
+                "index_type": index_kind(index),
+                "created_at": time.time(),
+            }
+            write_json(os.path.join(generation_dir(generation_id), "meta.json"), meta)
+            write_json(CURRENT_PATH, meta)
+        finally:
+            lease.release()
+        collect_generations()
+    return generation_id
+
+
+def delete_index():
+    """Stop serving an index (corpus reset); its files go once no reader holds them."""
+    with index_lock:
+        try:
+            os.remove(CURRENT_PATH)
+        except FileNotFoundError:
+            pass
+        collect_generations()
+
+
+def list_generations():
+    """Ids of the generations on disk: current, leased, or not collected yet."""
+    if not os.path.isdir(GENERATIONS_DIR):
+        return []
+    return sorted(name.removesuffix(".lease") for name in os.listdir(GENERATIONS_DIR) if name.endswith(".lease"))
+
+
+def collect_generations():
+    """Delete every generation that is neither current nor leased by a reader or a build."""
+    with index_lock:
+        current = current_generation()
+        for generation_id in list_generations():
+            if current is not None and generation_id == current["id"]:
+                continue
+            path = os.path.join(GENERATIONS_DIR, f"{generation_id}.lease")
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            try:
+                shutil.rmtree(generation_dir(generation_id), ignore_errors=True)
+                os.remove(path)
+                logging.info(f"Collected index generation {generation_id}")
+            finally:
+                os.close(fd)
+
+
+def init_index(model):
+    """
+    Adopt an index written before generations existed (as built with `model`,
+    the configured one) and collect generations abandoned by a crash.
+    """
+    with index_lock:
+        if os.path.exists(LEGACY_INDEX_PATH) and not os.path.exists(CURRENT_PATH):
+            import faiss
+
+            logging.info(f"Moving {LEGACY_INDEX_PATH} into an index generation")
+            publish_index(faiss.read_index(LEGACY_INDEX_PATH), model)
+            os.remove(LEGACY_INDEX_PATH)
+        collect_generations()
+
+
+def build_index(chunk_ids, vectors, model):
+    """Build a fresh index from scratch and publish it as a generation of `model`."""
+    with index_lock:
+        index = create_index(vectors, chunk_ids)
+        publish_index(index, model)
+        return index
+
+
+def add_to_index(chunk_ids, vectors, model, replace_ids=()):
+    """
+    Append vectors for new chunks (encoded with `model`, the served generation's
+    model) to the index, dropping the vectors of `replace_ids` (the chunks they
+    supersede) in the same write, and publish the result.
+    A flat index is retrained as the configured IVF type once the corpus
+    passes INDEX_IVF_TRAIN_THRESHOLD.
+    Returns False, without writing, when `replace_ids` cannot be removed in
+    place (HNSW) and the index must be rebuilt.
+    """
+    with index_lock:
+        index = load_index()
+        if index is not None and len(replace_ids):
+            if index_kind(index) == "hnsw":
+                return False
+            index.remove_ids(np.asarray(replace_ids, dtype="int64"))
+        if len(chunk_ids) and index is None:
+            index = create_index(vectors, chunk_ids)
+        elif len(chunk_ids):
+            index.add_with_ids(vectors, np.asarray(chunk_ids, dtype="int64"))
+            if index_kind(index) == "flat" and index_kind_for(index.ntotal) != "flat":
+                logging.info(f"Corpus reached {index.ntotal} vectors; training {INDEX_TYPE} index.")
+                all_vectors, all_ids = export_vectors(index)
+                index = create_index(all_vectors, all_ids)
+        if index is not None:
+            publish_index(index, model)
+        return True
+
+
+def remove_from_index(chunk_ids):
+    """
+    Drop the vectors of deleted chunks from the index and publish the result.
+    Returns False when the index type cannot delete in place (HNSW) and must be rebuilt.
+    """
+    with index_lock:
+        index = load_index()
+        if index is None or not chunk_ids:
+            return True
+        if index_kind(index) == "hnsw":
+            return False
+        index.remove_ids(np.asarray(chunk_ids, dtype="int64"))
+        publish_index(index, current_generation()["model"])
+        return True
@@ -0,0 +1,395 @@
+import fcntl
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import batched
+
+import numpy as np
+
+from cache import answer_cache
+from config import (
+    CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_ENCODING, INGEST_BATCH_CHUNKS, BULK_EXTRACT_PROCESSES, EMBEDDING_DIR,
+)
+from db import (
+    add_doc, commit_doc, remove_chunks, get_doc_chunk_ids, count_chunks, iter_chunk_texts, get_chunk_texts,
+    get_chunk_ids,
+)
+from dedup import PageFilter, file_hash, page_signature, skip_reason
+from embeddings import active_model, build_embeddings, model_id
+from index import (
+    build_index, add_to_index, create_index, current_generation, delete_index, generation_dir, generation_ids,
+    index_kind, is_position_mapped, load_index, index_lock, new_generation, publish_index,
+)
+from utils import iter_pages, chunk_pages
+
+INGEST_STAGES = ["processing", "indexing"]
+BULK_INGEST_STAGES = ["extracting", "storing", "embedding", "indexing"]
+REINDEX_STAGES = ["embedding", "catching_up", "indexing", "publishing"]
+
+
+def embed_chunks(model, spool=None, progress=None):
+    """
+    Encode every chunk in the DB with `model`, INGEST_BATCH_CHUNKS at a time.
+    Returns (ids, vectors). With `spool` (a file path) vectors are appended to
+    that file and returned memory-mapped rather than held in memory.
+    `progress` is called with the number of chunks encoded so far.
+    """
+    ids, parts = [], []
+    out = open(spool, "wb") if spool else None
+    try:
+        for batch in iter_chunk_texts(INGEST_BATCH_CHUNKS):
+            vectors = build_embeddings([text for _, text in batch], model=model)
+            ids += [chunk_id for chunk_id, _ in batch]
+            if out is not None:
+                out.write(vectors.tobytes())
+            else:
+                parts.append(vectors)
+            if progress is not None:
+                progress(len(ids))
+    finally:
+        if out is not None:
+            out.close()
+    ids = np.asarray(ids, dtype="int64")
+    if not len(ids):
+        return ids, None
+    if spool:
+        return ids, np.memmap(spool, dtype="float32", mode="r").reshape(len(ids), -1)
+    return ids, np.vstack(parts)
+
+
+def embed_ids(chunk_ids, model):
+    """(ids, vectors) for the given chunks that still exist, encoded with `model`."""
+    texts = get_chunk_texts(list(chunk_ids))
+    ids = np.asarray([i for i in chunk_ids if int(i) in texts], dtype="int64")
+    if not len(ids):
+        return ids, None
+    return ids, build_embeddings([texts[int(i)] for i in ids], model=model)
+
+
+def rebuild_index(model=None):
+    """Rebuild the index from all chunks in the DB, encoded with `model` (default: the served one)."""
+    with index_lock:
+        model = model or active_model()
+        ids, vectors = embed_chunks(model)
+        if not len(ids):
+            delete_index()
+            return None
+        return build_index(ids, vectors, model)
+
+
+def serves_position_mapped_index():
+    generation = current_generation()
+    return generation is not None and is_position_mapped(generation)
+
+
+def served_ids():
+    """Chunk ids the served generation holds (every chunk when there is no usable index)."""
+    with index_lock:
+        generation = current_generation()
+        if generation is not None and not is_position_mapped(generation):
+            return generation_ids(generation["id"])
+        # No index, or one that predates chunk ids
+        return np.asarray(get_chunk_ids(), dtype="int64")
+
+
+def level_arrays(ids, vectors, target, model):
+    """Drop the rows of `ids` not in `target` and append vectors for the `target` ids missing."""
+    keep = np.isin(ids, target)
+    if not keep.all():
+        ids, vectors = ids[keep], vectors[keep]
+    added_ids, added = embed_ids(np.setdiff1d(target, ids), model)
+    if len(added_ids):
+        ids = np.concatenate([ids, added_ids])
+        vectors = np.vstack([vectors, added]) if vectors is not None and len(vectors) else added
+    return ids, vectors
+
+
+def reindex(job, model=None, legacy_only=False):
+    """
+    Background rebuild into a new index generation, e.g. after EMBEDDING_MODEL
+    changed. Every chunk is encoded with `model` (default: the configured one)
+    and indexed while the current generation keeps serving queries and taking
+    ingests. The new generation is then brought level with the current one (the
+    chunks it gained or lost meanwhile) under index_lock, and published in one
+    pointer swap.
+    With `legacy_only` (the startup migration, queued by every server worker)
+    nothing is done unless a position-mapped legacy index is still served and
+    no other rebuild is running.
+    """
+    model = model or model_id()
+    # One re-index at a time across worker processes: a second would only redo the work
+    lock_fd = os.open(os.path.join(EMBEDDING_DIR, "reindex.lock"), os.O_CREAT | os.O_RDWR)
+    try:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if legacy_only:
+                return {"skipped": "another index rebuild is running"}
+            raise RuntimeError("Another index rebuild is already running")
+        if legacy_only and not serves_position_mapped_index():
+            return {"skipped": "the served index is id-mapped"}
+        lease = new_generation()
+        try:
+            return build_generation(job, model, lease)
+        finally:
+            lease.release()
+    finally:
+        os.close(lock_fd)
+
+
+def build_generation(job, model, lease):
+    job.meta.update(model=model, generation=lease.generation_id, chunks_embedded=0)
+    job.set_stage("embedding")
+    spool = os.path.join(generation_dir(lease.generation_id), "vectors.f32")
+    ids, vectors = embed_chunks(model, spool, lambda n: job.meta.update(chunks_embedded=n))
+
+    # Most of the catching up happens here, outside the lock, so the final step is short
+    job.set_stage("catching_up")
+    ids, vectors = level_arrays(ids, vectors, served_ids(), model)
+
+    job.set_stage("indexing")
+    index = create_index(np.ascontiguousarray(vectors), ids) if len(ids) else None
+
+    job.set_stage("publishing")
+    with index_lock:
+        target = served_ids()
+        removed = np.setdiff1d(ids, target)
+        added_ids, added = embed_ids(np.setdiff1d(target, ids), model)
+        if len(removed) and index is not None and index_kind(index) == "hnsw":
+            index = None  # cannot delete in place: rebuild from the stored vectors below
+        if index is None:
+            ids, vectors = level_arrays(ids, vectors, target, model)
+            index = create_index(np.ascontiguousarray(vectors), ids) if len(ids) else None
+        else:
+            if len(removed):
+                index.remove_ids(removed)
+            if len(added_ids):
+                index.add_with_ids(added, added_ids)
+        if index is None:
+            delete_index()
+            generation = None
+        else:
+            generation = publish_index(index, model, lease)
+    os.remove(spool)
+
+    total = index.ntotal if index is not None else 0
+    logging.info(f"Index generation {generation} published: {total} vectors encoded with {model}")
+    return {"generation": generation, "model": model, "vectors": total}
+
+
+def swap_into_index(chunk_ids, vectors, model, replaced_ids, commit, rebuild=False):
+    """
+    Index new chunks (encoded with `model`) and drop the `replaced_ids` they
+    supersede in a single index write, then run `commit` (the matching DB update)
+    under the same lock.
+    With `rebuild`, or an index that cannot delete in place, the index is rebuilt
+    from the DB after `commit` instead.
+    """
+    with index_lock:
+        served = active_model()
+        if vectors is not None and model != served:
+            # A generation built with another model was published while these were encoded
+            _, vectors = embed_ids(chunk_ids, served)
+        if not rebuild:
+            rebuild = not add_to_index(chunk_ids, vectors, served, replaced_ids)
+        commit()
+        if rebuild:
+            rebuild_index()
+
+
+def remove_stale_version(filename):
+    """
+    Drop the indexed version of `filename` after an upload under that name was
+    skipped as a copy of another doc: the file on disk no longer matches it.
+    Returns the number of chunks removed.
+    """
+    replaced_ids = get_doc_chunk_ids([filename])
+    if replaced_ids:
+        swap_into_index([], None, active_model(), replaced_ids, lambda: commit_doc(filename, None, (), replaced_ids))
+        answer_cache.invalidate()
+        logging.info(f"Removed {len(replaced_ids)} chunks of the previous version of '{filename}'")
+    return len(replaced_ids)
+
+
+def ingest_file(job, file_path, filename):
+    """
+    Background ingestion of one saved upload.
+    Unchanged re-uploads and copies of an indexed file are skipped (a copy
+    uploaded over another file replaces that file's indexed version). Otherwise
+    pages are read, near-duplicate pages dropped, and the rest chunked, stored and
+    embedded INGEST_BATCH_CHUNKS chunks at a time so memory stays bounded by the
+    batch rather than the file. Stored chunks stay pending (out of search) until
+    the index is updated once at the end, which swaps out the previous version of
+    the file in the same write as the DB commit that publishes the new one.
+    """
+    job.set_stage("processing")
+    content_hash = file_hash(file_path)
+    skipped = skip_reason(filename, content_hash)
+    if skipped:
+        logging.info(f"File '{filename}' not ingested: {skipped}")
+        if skipped["skipped"] == "duplicate":
+            skipped["chunks_replaced"] = remove_stale_version(filename)
+        return {"filename": filename, "chunks_added": 0, **skipped}
+    job.meta.update(pages_processed=0, pages_skipped=0, chunks_stored=0)
+
+    def counted_pages():
+        for page in iter_pages(file_path):
+            job.meta["pages_processed"] += 1
+            yield page
+
+    # Missing or legacy index while other docs exist: a partial add would drop them
+    needs_rebuild = load_index() is None and count_chunks() > 0
+    replaced_ids = get_doc_chunk_ids([filename])
+    model = active_model()
+
+    pages = PageFilter()
+    chunk_ids, vectors, fingerprints = [], [], []
+    try:
+        kept_pages = pages.filter(counted_pages(), fingerprints, filename)
+        chunks = chunk_pages(kept_pages, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_ENCODING)
+        for batch in batched(chunks, INGEST_BATCH_CHUNKS):
+            chunk_ids += add_doc(filename, batch, pending=True)
+            if not needs_rebuild:
+                vectors.append(build_embeddings([c["text"] for c in batch], model=model))
+            job.meta.update(chunks_stored=len(chunk_ids), pages_skipped=pages.pages_skipped)
+        if not chunk_ids and not pages.pages_skipped:
+            raise ValueError("No text extracted from file")
+
+        job.set_stage("indexing")
+        swap_into_index(
+            chunk_ids, np.vstack(vectors) if vectors else None, model, replaced_ids,
+            lambda: commit_doc(filename, content_hash, fingerprints, replaced_ids, chunk_ids),
+            rebuild=needs_rebuild,
+        )
+    except Exception:
+        # Don't leave a half-ingested file behind
+        remove_chunks(chunk_ids)
+        raise
+    answer_cache.invalidate()
+
+    logging.info(
+        f"File '{filename}' ingested: {len(chunk_ids)} chunks indexed, "
+        f"{pages.pages_skipped} near-duplicate pages skipped, {len(replaced_ids)} old chunks replaced."
+    )
+    return {
+        "filename": filename,
+        "chunks_added": len(chunk_ids),
+        "chunks_replaced": len(replaced_ids),
+        "pages_skipped": pages.pages_skipped,
+    }
+
+
+def extract_pages(file_path):
+    """Process-pool worker: parse one file into (page, text, signature) triples."""
+    pages = [(page, text, page_signature(text)) for page, text in iter_pages(file_path) if text.strip()]
+    if not pages:
+        raise ValueError("No text extracted from file")
+    return pages
+
+
+def ingest_files(job, file_paths):
+    """
+    Bulk ingestion of many saved files.
+    Files already indexed (same content hash) are skipped, and a copy uploaded
+    over another file drops that file's indexed version; text extraction of
+    the rest runs in a process pool, near-duplicate pages are dropped, all new
+    chunks are encoded in one batched call and the index is updated once at the
+    end.
+    """
+    start_time = time.time()
+    job.meta.update(files_total=len(file_paths), files_extracted=0)
+
+    job.set_stage("extracting")
+    pending, skipped, hashes, stale = {}, [], {}, []
+    for path in file_paths:
+        filename, content_hash = os.path.basename(path), file_hash(path)
+        reason = skip_reason(filename, content_hash)
+        if reason is None and content_hash in hashes:
+            reason = {"skipped": "duplicate", "duplicate_of": hashes[content_hash]}
+        if reason:
+            if reason["skipped"] == "duplicate":
+                stale.append(filename)
+            skipped.append({"filename": filename, **reason})
+            job.meta["files_extracted"] += 1
+            continue
+        hashes[content_hash] = filename
+        pending[path] = content_hash
+
+    extracted, failed = [], []
+    # Fork explicitly: spawned workers would re-import the app and load the embedding model
+    ctx = multiprocessing.get_context("fork")
+    workers = max(1, min(BULK_EXTRACT_PROCESSES, len(pending)))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = {pool.submit(extract_pages, p): p for p in pending}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                extracted.append((os.path.basename(path), pending[path], future.result()))
+            except Exception as e:
+                failed.append({"filename": os.path.basename(path), "error": str(e)})
+            job.meta["files_extracted"] += 1
+
+    job.set_stage("storing")
+    pages = PageFilter()
+    chunk_ids, texts, replaced_ids, commits = [], [], [], []
+    try:
+        for filename, content_hash, file_pages in extracted:
+            old_ids = get_doc_chunk_ids([filename])
+            fingerprints = []
+            kept_pages = [
+                (page, text) for page, text, h in file_pages if pages.keep(h, fingerprints, filename)
+            ]
+            chunks = list(chunk_pages(kept_pages, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_ENCODING))
+            new_ids = add_doc(filename, chunks, pending=True) if chunks else []
+            chunk_ids += new_ids
+            texts += [c["text"] for c in chunks]
+            replaced_ids += old_ids
+            commits.append((filename, content_hash, fingerprints, old_ids, new_ids))
+        for filename in stale:
+            # Removed in the same index write as the new chunks
+            old_ids = get_doc_chunk_ids([filename])
+            if old_ids:
+                replaced_ids += old_ids
+                commits.append((filename, None, (), old_ids, []))
+
+        if commits:
+            job.set_stage("embedding")
+            # Missing or legacy index while other docs exist: rebuild instead of adding
+            rebuild = load_index() is None and count_chunks() > 0
+            model = active_model()
+            vectors = build_embeddings(texts, model=model) if texts and not rebuild else None
+
+            job.set_stage("indexing")
+
+            def commit():
+                for args in commits:
+                    commit_doc(*args)
+
+            swap_into_index(chunk_ids, vectors, model, replaced_ids, commit, rebuild=rebuild)
+    except Exception:
+        # Don't leave pending chunks behind
+        remove_chunks(chunk_ids)
+        raise
+    if commits:
+        answer_cache.invalidate()
+
+    elapsed = max(time.time() - start_time, 1e-9)
+    result = {
+        "files_ingested": len(extracted),
+        "files_skipped": skipped,
+        "files_failed": failed,
+        "chunks_added": len(texts),
+        "chunks_replaced": len(replaced_ids),
+        "pages_skipped": pages.pages_skipped,
+        "elapsed_time": elapsed,
+        "files_per_sec": len(extracted) / elapsed,
+        "chunks_per_sec": len(texts) / elapsed,
+    }
+    logging.info(
+        f"Bulk ingest: {len(extracted)} files ({len(skipped)} skipped), {len(texts)} chunks "
+        f"({pages.pages_skipped} near-duplicate pages skipped) in {elapsed:.1f}s "
+        f"({result['files_per_sec']:.1f} files/s, {result['chunks_per_sec']:.1f} chunks/s)"
+    )
+    return result
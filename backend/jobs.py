@@ -0,0 +1,134 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from config import INGEST_WORKERS, JOB_HISTORY
+from db import save_job, get_job, prune_jobs
+from metrics import INGEST_STAGE_SECONDS, JOBS
+
+
+class Job:
+    """A unit of background work whose progress is reported by named stages."""
+
+    def __init__(self, kind, stages, meta=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.stages = list(stages)
+        self.meta = meta or {}
+        self.status = "queued"  # queued -> running -> done | failed
+        self.stage = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stage_times = {}
+        self.listener = None  # called with the job on every stage change
+
+    def set_stage(self, stage):
+        now = time.time()
+        if self.stage in self.stage_times:
+            self.stage_times[self.stage]["finished_at"] = now
+            INGEST_STAGE_SECONDS.labels(self.kind, self.stage).observe(now - self.stage_times[self.stage]["started_at"])
+        self.stage = stage
+        self.stage_times[stage] = {"started_at": now}
+        if self.listener is not None:
+            self.listener(self)
+
+    def to_dict(self):
+        done = self.stages.index(self.stage) if self.stage in self.stages else 0
+        if self.status == "done":
+            done = len(self.stages)
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": done / len(self.stages) if self.stages else 1.0,
+            "stages": self.stages,
+            "stage_times": self.stage_times,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+            **self.meta,
+        }
+
+
+class JobQueue:
+    """
+    Thread pool that runs jobs in the background and keeps their recent history.
+    Job status is also written to the database at every stage change, so any
+    server worker process can answer GET /jobs/<id>.
+    """
+
+    def __init__(self, workers=INGEST_WORKERS, history=JOB_HISTORY):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._history = history
+
+    def submit(self, kind, stages, fn, *args, meta=None):
+        """Queue `fn(job, *args)`; its return value becomes the job result."""
+        job = Job(kind, stages, meta)
+        job.listener = self._persist
+        self._persist(job)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self._history:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.status in ("queued", "running"):
+                    break
+                self._jobs.popitem(last=False)
+        self._pool.submit(self._run, job, fn, args)
+        return job
+
+    def _persist(self, job):
+        try:
+            save_job(job.id, json.dumps(job.to_dict(), default=str), time.time())
+            if job.finished_at is not None:
+                prune_jobs(self._history)
+        except Exception as e:
+            logging.warning(f"Could not persist job {job.id}: {e}")
+
+    def _run(self, job, fn, args):
+        job.status = "running"
+        job.started_at = time.time()
+        self._persist(job)
+        try:
+            job.result = fn(job, *args)
+            job.set_stage("done")
+            job.status = "done"
+        except Exception as e:
+            logging.error(f"Job {job.id} ({job.kind}) failed at {job.stage}: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            JOBS.labels(job.kind, job.status).inc()
+            self._persist(job)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id):
+        """Status dict of a job run by this or any other worker process, or None."""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        data = get_job(job_id)
+        return json.loads(data) if data else None
+
+    def stats(self):
+        with self._lock:
+            statuses = [j.status for j in self._jobs.values()]
+        return {s: statuses.count(s) for s in ("queued", "running", "done", "failed")}
+
+
+job_queue = JobQueue()
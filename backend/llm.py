@@ -1,19 +1,189 @@
+import json
+import logging
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    LMSTUDIO_API_URL,
+    LLM_MODEL,
+    LLM_MODEL_MAX_TOKENS,
+    LLM_MAX_INFLIGHT,
+    LLM_MAX_QUEUE,
+    LLM_QUEUE_TIMEOUT,
+    LLM_TIMEOUT,
+    LLM_RETRIES,
+    LLM_RETRY_BACKOFF,
+)
+from metrics import LLM_REQUESTS, LLM_RETRIES_TOTAL, LLM_INFLIGHT, LLM_QUEUED, observe
+
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class LLMBusy(Exception):
+    """No generation slot is available; the caller should retry after `retry_after` seconds."""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class LLMClient:
+    """
+    Client for the OpenAI-compatible model server.
+    Connections are pooled in one session, at most `max_inflight` generations run
+    at once and up to `max_queue` more wait (for at most `queue_timeout` seconds)
+    for a slot. Beyond that requests are rejected with LLMBusy instead of piling up.
+    """
+
+    def __init__(self, url=LMSTUDIO_API_URL, max_inflight=LLM_MAX_INFLIGHT, max_queue=LLM_MAX_QUEUE,
+                 queue_timeout=LLM_QUEUE_TIMEOUT, timeout=LLM_TIMEOUT, retries=LLM_RETRIES,
+                 backoff=LLM_RETRY_BACKOFF):
+        self.url = url
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_inflight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._inflight = 0
+        self._avg_generation = None  # moving average of slot hold time, seconds
+        self._stats = {"completed": 0, "failed": 0, "rejected": 0, "timed_out": 0, "retries": 0,
+                       "wait_total": 0.0, "wait_max": 0.0}
+
+    def retry_after(self):
+        """Rough seconds until a slot frees up, from queue depth and generation time."""
+        avg = self._avg_generation or self.queue_timeout
+        return max(1, math.ceil(avg * (self._waiting + 1) / self.max_inflight))
+
+    @contextmanager
+    def slot(self):
+        """Hold one generation slot, waiting in the queue up to the deadline."""
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self._stats["rejected"] += 1
+                LLM_REQUESTS.labels("rejected").inc()
+                raise LLMBusy("LLM queue is full", 429, self.retry_after())
+            self._waiting += 1
+        LLM_QUEUED.inc()
+
+        start = time.monotonic()
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        waited = time.monotonic() - start
+        LLM_QUEUED.dec()
+        observe("llm_queue", waited)
+        with self._lock:
+            self._waiting -= 1
+            self._stats["wait_total"] += waited
+            self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+            if not acquired:
+                self._stats["timed_out"] += 1
+                LLM_REQUESTS.labels("timed_out").inc()
+                raise LLMBusy(f"No LLM slot free after {self.queue_timeout:.0f}s", 503, self.retry_after())
+            self._inflight += 1
+        LLM_INFLIGHT.inc()
+
+        start = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            held = time.monotonic() - start
+            LLM_INFLIGHT.dec()
+            LLM_REQUESTS.labels("completed" if ok else "failed").inc()
+            with self._lock:
+                self._inflight -= 1
+                self._stats["completed" if ok else "failed"] += 1
+                if ok:
+                    prev = self._avg_generation
+                    self._avg_generation = held if prev is None else 0.8 * prev + 0.2 * held
+            self._slots.release()
+
+    def _post(self, payload, stream=False):
+        """POST with retries on connection errors and transient statuses (exponential backoff + jitter)."""
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = self.session.post(self.url, json=payload, stream=stream, timeout=(5, self.timeout))
+            except requests.ConnectionError:
+                if last:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or last:
+                    response.raise_for_status()
+                    return response
+                response.close()
+            delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            logging.warning(f"LLM request failed (attempt {attempt + 1}), retrying in {delay:.2f}s")
+            with self._lock:
+                self._stats["retries"] += 1
+            LLM_RETRIES_TOTAL.inc()
+            time.sleep(delay)
+
+    def complete(self, prompt):
+        """Blocking chat completion; returns the first choice's message."""
+        payload = {"model": LLM_MODEL, "messages": prompt, "max_tokens": LLM_MODEL_MAX_TOKENS}
+        with self.slot():
+            response = self._post(payload)
+            return response.json()["choices"][0]["message"]
+
+    def stream(self, prompt):
+        """
+        Stream a completion using the OpenAI-compatible `stream: true` API.
+        Yields ("content", text) and ("reasoning", text) deltas as they arrive.
+        """
+        payload = {"model": LLM_MODEL, "messages": prompt, "max_tokens": LLM_MODEL_MAX_TOKENS, "stream": True}
+        with self.slot(), self._post(payload, stream=True) as response:
+            for raw in response.iter_lines():
+                line = raw.decode("utf-8")
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                delta = choices[0].get("delta", {})
+                if delta.get("reasoning"):
+                    yield "reasoning", delta["reasoning"]
+                if delta.get("content"):
+                    yield "content", delta["content"]
+
+    def stats(self):
+        with self._lock:
+            served = self._stats["completed"] + self._stats["failed"] + self._stats["timed_out"]
+            return {
+                "max_inflight": self.max_inflight,
+                "inflight": self._inflight,
+                "queue_depth": self._waiting,
+                "max_queue": self.max_queue,
+                "avg_wait": self._stats["wait_total"] / served if served else 0.0,
+                "avg_generation": self._avg_generation or 0.0,
+                **self._stats,
+            }
+
+
+llm_client = LLMClient()
+
+
+def query_llm(prompt):
+    return llm_client.complete(prompt)
+
 
-from config import LMSTUDIO_API_URL, LLM_MODEL, LLM_MODEL_MAX_TOKENS
-
-def query_llm(prompt: str):
-    response = requests.post(
-        LMSTUDIO_API_URL,
-        json={
-            "model": LLM_MODEL,
-            "messages": prompt,
-            "max_tokens": LLM_MODEL_MAX_TOKENS
-        },
-        timeout=120
-    )
-    response.raise_for_status()
-    response.json()
-    lm_data = response.json()
-    choice = lm_data["choices"][0]["message"]
-    return choice
+def stream_llm(prompt):
+    return llm_client.stream(prompt)
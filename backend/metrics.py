@@ -0,0 +1,106 @@
+"""
+Prometheus metrics and per-request stage timings.
+
+Hot-path code wraps each stage in `timed("stage")`: the duration goes into the
+`rag_stage_seconds` histogram and, inside `collect_timings()`, into the
+request's own timings dict (returned as `timings` by /ask).
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(set in gunicorn.conf.py) and /metrics merges them, so a scrape sees the
+whole server rather than whichever worker answered it.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+INGEST_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent in each query pipeline stage", ["stage"],
+                          buckets=STAGE_BUCKETS)
+REQUEST_SECONDS = Histogram("rag_http_request_seconds", "HTTP request latency (until the response starts)",
+                            ["endpoint", "method"], buckets=STAGE_BUCKETS)
+REQUESTS = Counter("rag_http_requests_total", "HTTP requests", ["endpoint", "method", "status"])
+
+CACHE_LOOKUPS = Counter("rag_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+
+INGEST_STAGE_SECONDS = Histogram("rag_ingest_stage_seconds", "Time spent in each ingestion job stage",
+                                 ["kind", "stage"], buckets=INGEST_BUCKETS)
+JOBS = Counter("rag_jobs_total", "Finished background jobs", ["kind", "status"])
+INGEST_SKIPPED = Counter("rag_ingest_skipped_total", "Files and pages skipped as duplicates during ingestion",
+                         ["reason"])
+
+EMBED_BATCH_SIZE = Histogram("rag_query_embed_batch_size", "Queries encoded per micro-batch",
+                             buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+PROMPT_TOKENS = Histogram("rag_prompt_tokens", "Prompt size sent to the LLM",
+                          buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768))
+
+LLM_REQUESTS = Counter("rag_llm_requests_total", "LLM requests by outcome", ["outcome"])
+LLM_RETRIES_TOTAL = Counter("rag_llm_retries_total", "LLM requests retried after a transient failure")
+LLM_INFLIGHT = Gauge("rag_llm_inflight", "Generations running", multiprocess_mode="livesum")
+LLM_QUEUED = Gauge("rag_llm_queued", "Requests waiting for a generation slot", multiprocess_mode="livesum")
+
+INDEX_VECTORS = Gauge("rag_index_vectors", "Vectors in the FAISS index", multiprocess_mode="mostrecent")
+DOCUMENTS = Gauge("rag_documents", "Documents in the corpus", multiprocess_mode="mostrecent")
+CHUNKS = Gauge("rag_chunks", "Chunks in the corpus", multiprocess_mode="mostrecent")
+
+_timings = ContextVar("timings", default=None)
+
+
+@contextmanager
+def collect_timings(timings=None):
+    """Collect the stages timed in this context into a {stage: seconds} dict (new unless given)."""
+    timings = {} if timings is None else timings
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+_END = object()
+
+
+def iter_collecting(iterator, timings):
+    """
+    Yield from `iterator`, collecting the stages it times into `timings`.
+    Only each step runs inside the context, so a streaming response can yield
+    between steps without leaving it open.
+    """
+    while True:
+        with collect_timings(timings):
+            item = next(iterator, _END)
+        if item is _END:
+            return
+        yield item
+
+
+def observe(stage, seconds):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def render():
+    """(body, content type) of all metrics in Prometheus text format."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,5 +1,5 @@
-import tiktoken
-from config import LLM_MODEL, LLM_MODEL_MAX_TOKENS
+from config import CHUNK_ENCODING
+from utils import get_encoder
 
 
 def get_prompt(user_question, context_text, allow_fallback=False, extra_rules=None):
@@ -30,29 +30,20 @@ Context:
     return prompt
 
 
-def truncate_context(chunks, user_question, max_tokens=LLM_MODEL_MAX_TOKENS, model='cl100k_base'):
-    """
-    Truncate context to fit within max_tokens.
-    Always keeps the user_question fully.
-    """
-    enc = tiktoken.get_encoding(model)
-
-    # Start budget with question
-    q_tokens = len(enc.encode(user_question))
-    budget = max_tokens - q_tokens - 200  # keep 200 tokens for system + safety margin
-
-    context_texts = []
-    used_tokens = 0
-
-    for chunk in chunks:
-        text = chunk["text"]
-        tokens = len(enc.encode(text))
-        if used_tokens + tokens <= budget:
-            context_texts.append(
-                f"[Source: {chunk.get('source', 'unknown')}] {text}"
-            )
-            used_tokens += tokens
-        else:
-            break
-
-    return "\n\n".join(context_texts)
\ No newline at end of file
+def format_context_entry(chunk, i=0):
+    """One retrieved chunk as it appears in the prompt context."""
+    return f"[Source: {chunk.get('source', f'retrieved_doc_{i + 1}')}]\n{chunk['text']}"
+
+
+def build_context_text(context_chunks):
+    """Build context text for LLM."""
+    return "\n\n".join(format_context_entry(chunk, i) for i, chunk in enumerate(context_chunks))
+
+
+def count_tokens(text):
+    return len(get_encoder(CHUNK_ENCODING).encode(text))
+
+
+def count_prompt_tokens(prompt):
+    """Approximate prompt size: message contents plus ~4 tokens of chat framing each."""
+    return sum(count_tokens(m["content"]) + 4 for m in prompt)
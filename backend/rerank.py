@@ -0,0 +1,61 @@
+import logging
+import threading
+
+import numpy as np
+
+from cache import normalize_question, score_cache
+from config import RERANK_MODEL, RERANK_CANDIDATES, RERANK_MAX_LENGTH, RERANK_BATCH_SIZE
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """Load the cross-encoder on first use so it costs nothing while reranking is off."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import CrossEncoder
+
+            logging.info(f"Loading rerank model {RERANK_MODEL}")
+            _model = CrossEncoder(RERANK_MODEL, max_length=RERANK_MAX_LENGTH, device="cpu")
+    return _model
+
+
+def rerank_batch(queries, candidate_lists, n_candidates=RERANK_CANDIDATES):
+    """
+    Rerank the first `n_candidates` chunks retrieved for each query with the
+    cross-encoder. Uncached (query, chunk) pairs of all queries are scored in one
+    batched call. Reranked chunks gain `rerank_score` (raw logit) and `relevance`
+    (its sigmoid, 0-1) and come first, best first; the rest keep their order.
+    """
+    keys = [
+        [(normalize_question(q), c["id"]) for c in cands[:n_candidates]]
+        for q, cands in zip(queries, candidate_lists)
+    ]
+    scores = score_cache.get_many([k for row in keys for k in row])
+
+    pending = {}
+    for q, cands, row in zip(queries, candidate_lists, keys):
+        for c, key in zip(cands, row):
+            if key not in scores and key not in pending:
+                pending[key] = (q, c["text"])
+    if pending:
+        predicted = get_model().predict(list(pending.values()), batch_size=RERANK_BATCH_SIZE)
+        new_scores = list(zip(pending, (float(s) for s in predicted)))
+        score_cache.put_many(new_scores)
+        scores.update(new_scores)
+
+    results = []
+    for cands, row in zip(candidate_lists, keys):
+        reranked = [
+            {**c, "rerank_score": scores[key], "relevance": float(1 / (1 + np.exp(-scores[key])))}
+            for c, key in zip(cands, row)
+        ]
+        reranked.sort(key=lambda c: c["rerank_score"], reverse=True)
+        results.append(reranked + cands[n_candidates:])
+    return results
+
+
+def rerank(query, candidates, n_candidates=RERANK_CANDIDATES):
+    return rerank_batch([query], [candidates], n_candidates)[0]
@@ -1,53 +1,224 @@
-import os
 import logging
-import faiss
-from config import EMBEDDING_DIR, TOP_K
-from embeddings import get_embedding
-from db import get_all_chunks
+import re
+import threading
 
-index_path = f"{EMBEDDING_DIR}/document_index.faiss"
+from config import TOP_K, INDEX_MMAP, RETRIEVAL_MODE, HYBRID_CANDIDATES, RRF_K
+from embeddings import get_embedding, get_embeddings, model_id, unload_models
+from db import get_chunks_by_ids, get_doc_chunk_ids, search_chunks_fts
+from index import GenerationLease, index_stamp, open_index, search_subset
+from metrics import INDEX_VECTORS, timed
 
 
-def check_index_exists() -> bool:
-    return os.path.exists(index_path)
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
 
 
-def load_index():
-    if not check_index_exists():
-        return None
-    return faiss.read_index(index_path)
+class Retriever:
+    """
+    Process-wide holder for the served index generation.
+    The index is read once and only reloaded when CURRENT points to another
+    generation. A memory-mapped index keeps a lease on its generation until it
+    is replaced, so its files are not collected from under it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current = (None, None)  # (generation, index), replaced as a whole
+        self._lease = None
+        self._stamp = None
+
+    def current(self):
+        """(generation, index) being served; index is None when there is none to search."""
+        stamp = index_stamp()
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    with timed("index_load"):
+                        generation, index, lease = open_index(mmap=INDEX_MMAP)
+                    if lease is not None and not INDEX_MMAP:
+                        lease.release()  # fully read into memory
+                        lease = None
+                    if self._lease is not None:
+                        self._lease.release()
+                    previous = self._current[0]
+                    self._current, self._lease, self._stamp = (generation, index), lease, stamp
+                    INDEX_VECTORS.set(index.ntotal if index is not None else 0)
+                    if previous is not None and generation is not None and previous["model"] != generation["model"]:
+                        # Switched models: the old one is only dead weight now
+                        unload_models({generation["model"], model_id()})
+        return self._current
+
+    def get_index(self):
+        return self.current()[1]
+
+    def is_loaded(self):
+        """True once an index has been read, or when there is none to read yet."""
+        return self._stamp is not None or index_stamp() is None
+
+    def release_lease(self):
+        """Drop this process's lease (the gunicorn master, whose workers take their own)."""
+        with self._lock:
+            if self._lease is not None:
+                self._lease.release()
+                self._lease = None
+
+    def renew_lease(self):
+        """
+        In a forked worker: lease the inherited memory-mapped generation for this
+        process, or reload on next use if it has been collected meanwhile.
+        """
+        with self._lock:
+            generation, index = self._current
+            if not INDEX_MMAP or index is None:
+                return
+            lease = GenerationLease(generation["id"])
+            if lease.acquire():
+                self._lease = lease
+            else:
+                self._stamp = object()
+
+    def search(self, q_embs, top_k: int = TOP_K, chunk_ids=None, index=None):
+        """
+        Search a batch of query vectors, only among `chunk_ids` when given, in
+        `index` (default: the served one; pass the index from current() whose
+        model encoded the queries).
+        Returns one list of {id, text, source, score, relevance} dicts per query row.
+        """
+        index = index if index is not None else self.get_index()
+        if index is None or (chunk_ids is not None and not chunk_ids):
+            return [[] for _ in range(len(q_embs))]
 
+        # FAISS search (returns chunk ids, -1 for empty slots)
+        with timed("faiss_search"):
+            if chunk_ids is None:
+                distances, ids = index.search(q_embs, top_k)
+            else:
+                distances, ids = search_subset(index, q_embs, top_k, chunk_ids)
 
-def retrieve_chunks(query: str, top_k: int = TOP_K):
+        # Fetch only the hit rows from the DB
+        hit_ids = {int(i) for i in ids.ravel() if i >= 0}
+        chunks = get_chunks_by_ids(hit_ids)
+
+        results = []
+        for row_dists, row_ids in zip(distances, ids):
+            row = []
+            for dist, chunk_id in zip(row_dists, row_ids):
+                chunk = chunks.get(int(chunk_id))
+                if chunk is None:
+                    continue
+                row.append({
+                    **chunk,
+                    "score": float(dist),  # smaller = closer match
+                    # Embeddings are unit length, so squared L2 = 2 - 2 * cosine
+                    "relevance": min(1.0, max(0.0, 1.0 - float(dist) / 2)),
+                })
+            results.append(row)
+        return results
+
+
+retriever = Retriever()
+
+
+def fts_query(query: str):
     """
-    Search FAISS index for the most relevant chunks.
-    Returns a list of dicts: {text, source, score}.
+    Turn free text into an FTS5 MATCH expression: every whitespace-separated
+    term is quoted (so identifiers like AB-1234 match as a phrase) and OR-ed,
+    leaving ranking to BM25.
     """
-    if not check_index_exists():
-        logging.warning("No FAISS index found.")
+    terms = []
+    for raw in query.split():
+        parts = re.findall(r"\w+", raw)
+        if parts:
+            terms.append('"' + " ".join(parts) + '"')
+    return " OR ".join(terms)
+
+
+def lexical_search(query: str, top_k: int = TOP_K, docs=None):
+    """BM25 search through SQLite's FTS5 index. Returns [{id, text, source, score}]."""
+    match = fts_query(query)
+    if not match:
         return []
+    hits = search_chunks_fts(match, top_k, docs)
+    chunks = get_chunks_by_ids([chunk_id for chunk_id, _ in hits])
+    return [
+        {**chunks[chunk_id], "score": float(score)}  # bm25: more negative = better
+        for chunk_id, score in hits
+        if chunk_id in chunks
+    ]
 
-    index = load_index()
+
+def fuse_rankings(rankings, top_k: int = TOP_K, k: int = RRF_K):
+    """Reciprocal rank fusion of several ranked chunk lists."""
+    scores, chunks = {}, {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking):
+            scores[chunk["id"]] = scores.get(chunk["id"], 0.0) + 1.0 / (k + rank + 1)
+            chunks.setdefault(chunk["id"], chunk)
+    best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [{**chunks[i], "score": scores[i]} for i in best]  # rrf: higher = better
+
+
+def retrieve_chunks(query: str, top_k: int = TOP_K, q_emb=None, mode: str = RETRIEVAL_MODE, docs=None,
+                    q_model=None):
+    """
+    Find the most relevant chunks for a query.
+    mode: "vector" (FAISS, score = L2 distance), "lexical" (FTS5, score = bm25)
+    or "hybrid" (both fused with reciprocal rank fusion, score = RRF).
+    Pass `q_emb` to reuse an already computed query embedding (encoded with
+    `q_model`; it is encoded again if the served generation uses another model),
+    and `docs` (filenames) to search only those documents.
+    Returns a list of dicts: {id, text, source, score}.
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+
+    if mode == "lexical":
+        return lexical_search(query, top_k, docs)
+
+    generation, index = retriever.current()
     if index is None:
-        return []
+        logging.warning("No FAISS index found.")
+        return lexical_search(query, top_k, docs) if mode == "hybrid" else []
+
+    chunk_ids = get_doc_chunk_ids(docs) if docs is not None else None
+
+    # Encode query → vector, with the model the index was built with
+    if q_emb is None or (q_model is not None and q_model != generation["model"]):
+        q_emb = get_embedding(query, generation["model"])
+    q_emb = q_emb.reshape(1, -1).astype("float32")
+
+    if mode == "vector":
+        return retriever.search(q_emb, top_k, chunk_ids, index)[0]
 
-    # Encode query → vector
-    q_emb = get_embedding(query).reshape(1, -1).astype("float32")
+    n_candidates = max(top_k, HYBRID_CANDIDATES)
+    dense = retriever.search(q_emb, n_candidates, chunk_ids, index)[0]
+    return fuse_rankings([dense, lexical_search(query, n_candidates, docs)], top_k)
 
-    # FAISS search
-    distances, idxs = index.search(q_emb, top_k)
 
-    # Load all chunks from DB
-    chunks = get_all_chunks()
+def retrieve_chunks_batch(queries, top_k: int = TOP_K, mode: str = RETRIEVAL_MODE, docs=None):
+    """
+    Retrieve chunks for many queries with one encode call and one FAISS search
+    (the lexical side of hybrid/lexical mode runs per query).
+    `docs` restricts every query to those documents.
+    Returns one result list per query, in order.
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+    if not queries:
+        return []
+    generation, index = retriever.current() if mode != "lexical" else (None, None)
+    if index is None:
+        if mode == "vector":
+            return [[] for _ in queries]
+        return [lexical_search(q, top_k, docs) for q in queries]
 
-    results = []
-    for dist, idx in zip(distances[0], idxs[0]):
-        if idx < 0 or idx >= len(chunks):
-            continue
-        results.append({
-            "text": chunks[idx]["text"],
-            "source": chunks[idx]["source"],
-            "score": float(dist)  # smaller = closer match
-        })
+    chunk_ids = get_doc_chunk_ids(docs) if docs is not None else None
+    q_embs = get_embeddings(list(queries), generation["model"])
+    if mode == "vector":
+        return retriever.search(q_embs, top_k, chunk_ids, index)
 
-    return results
+    n_candidates = max(top_k, HYBRID_CANDIDATES)
+    dense = retriever.search(q_embs, n_candidates, chunk_ids, index)
+    return [
+        fuse_rankings([d, lexical_search(q, n_candidates, docs)], top_k)
+        for q, d in zip(queries, dense)
+    ]
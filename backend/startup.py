@@ -0,0 +1,55 @@
+import logging
+import threading
+import time
+
+from embeddings import active_model, get_embedding, is_model_loaded
+from ingest import REINDEX_STAGES, reindex, serves_position_mapped_index
+from jobs import job_queue
+from retrieval import retriever
+
+_state = {"warmup": "idle", "error": None, "warmup_time": None}
+
+
+def warm_up():
+    """Load the embedding model (by encoding a dummy query) and the FAISS index."""
+    _state["warmup"] = "running"
+    start = time.perf_counter()
+    try:
+        get_embedding("warm-up")
+        retriever.get_index()
+    except Exception as e:
+        logging.error(f"Warm-up failed: {e}")
+        _state.update(warmup="failed", error=str(e))
+        return
+    _state.update(warmup="done", warmup_time=time.perf_counter() - start)
+    logging.info(f"Warm-up finished in {_state['warmup_time']:.2f}s")
+
+
+def start_warm_up():
+    """Warm up in a background thread so the server accepts requests immediately."""
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+def queue_legacy_rebuild():
+    """
+    Queue a background rebuild when the served index predates chunk-id mapping:
+    vector search finds nothing in it until then. Called in every serving process
+    (not the preloading master, whose job threads would not survive the fork);
+    all but one of the queued jobs find nothing to do.
+    """
+    if not serves_position_mapped_index():
+        return None
+    model = active_model()
+    job = job_queue.submit("reindex", REINDEX_STAGES, reindex, model, True, meta={"model": model})
+    logging.info(f"Serving an index without chunk ids; rebuild queued as job {job.id}")
+    return job
+
+
+def readiness():
+    """(ready, details): ready once the model is loaded and the index on disk has been read."""
+    details = {
+        "model_loaded": is_model_loaded(),
+        "index_loaded": retriever.is_loaded(),
+        **_state,
+    }
+    return details["model_loaded"] and details["index_loaded"], details
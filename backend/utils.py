@@ -1,21 +1,85 @@
 import re
-from PyPDF2 import PdfReader
-from docx import Document
+from functools import lru_cache
 
 ALLOWED_EXTENSIONS = {"pdf", "docx"}
 
-def extract_text_from_pdf(path):
+@lru_cache(maxsize=None)
+def get_encoder(encoding="cl100k_base"):
+    """tiktoken encoders are expensive to build; share one per encoding."""
+    import tiktoken
+
+    return tiktoken.get_encoding(encoding)
+
+def iter_pdf_pages(path):
+    """Yield (page_number, text) one page at a time."""
+    from PyPDF2 import PdfReader
+
     reader = PdfReader(path)
-    return "\n".join(page.extract_text() for page in reader.pages)
+    for number, page in enumerate(reader.pages, start=1):
+        yield number, page.extract_text() or ""
+
+def iter_docx_pages(path):
+    """DOCX has no fixed pages; yield each paragraph with page None."""
+    from docx import Document
 
-def extract_text_from_docx(path):
     doc = Document(path)
-    return "\n".join(p.text for p in doc.paragraphs)
+    for p in doc.paragraphs:
+        yield None, p.text
+
+def iter_pages(path):
+    if path.lower().endswith(".pdf"):
+        return iter_pdf_pages(path)
+    if path.lower().endswith(".docx"):
+        return iter_docx_pages(path)
+    raise ValueError("Unsupported file type")
+
+def chunk_pages(pages, chunk_size=500, overlap=50, encoding="cl100k_base"):
+    """
+    Stream (page, text) pairs into chunks of `chunk_size` tokens where each chunk
+    repeats the last `overlap` tokens of the previous one.
+    Yields {"text", "page_start", "page_end"}; only one chunk plus the current
+    page is held in memory at a time. Cuts that would split a multi-byte
+    character move forward to the next token that starts one.
+    """
+    enc = get_encoder(encoding)
+    step = chunk_size - min(overlap, chunk_size - 1)
+    tokens, token_pages = [], []
+    covered = 0  # leading tokens of the buffer already included in an emitted chunk
 
-def chunk_text(text, chunk_size=500):
-    words = text.split()
-    for i in range(0, len(words), chunk_size):
-        yield " ".join(words[i:i+chunk_size])
+    for page, text in pages:
+        if not text.strip():
+            continue
+        new_tokens = enc.encode(text + "\n")
+        tokens += new_tokens
+        token_pages += [page] * len(new_tokens)
+
+        start = 0
+        while len(tokens) - start >= chunk_size:
+            # Page token runs end on a whole character, so these never run past the buffer
+            first, end = _char_start(enc, tokens, start), _char_start(enc, tokens, start + chunk_size)
+            yield _make_chunk(enc, tokens[first:end], token_pages[first:end])
+            start += step
+            covered = chunk_size - step
+        del tokens[:start]
+        del token_pages[:start]
+
+    if len(tokens) > covered:
+        first = _char_start(enc, tokens, 0)
+        yield _make_chunk(enc, tokens[first:], token_pages[first:])
+
+def _char_start(enc, tokens, i):
+    """First index >= i whose token does not begin inside a UTF-8 character."""
+    while i < len(tokens) and 0x80 <= enc.decode_single_token_bytes(tokens[i])[0] < 0xC0:
+        i += 1
+    return i
+
+def _make_chunk(enc, tokens, token_pages):
+    numbered = [p for p in token_pages if p is not None]
+    return {
+        "text": enc.decode(tokens).strip(),
+        "page_start": numbered[0] if numbered else None,
+        "page_end": numbered[-1] if numbered else None,
+    }
 
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -24,4 +88,3 @@ def extract_sources(answer: str):
     """Extract unique doc names cited in the answer."""
     pattern = r"\[Source:\s*([^\]]+)\]"
     return list(dict.fromkeys(re.findall(pattern, answer)))
-
@@ -0,0 +1,63 @@
+import argparse
+import json
+import sys
+import time
+
+import requests
+
+API_URL = "http://localhost:8000"
+
+
+def read_questions(path):
+    """One question per line; blank lines are skipped."""
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def ask_batch(questions, allow_fallback=False, concurrency=None, api_url=API_URL):
+    """Send questions to /ask/batch and yield results as they stream back."""
+    payload = {"questions": questions, "allow_fallback": allow_fallback}
+    if concurrency:
+        payload["concurrency"] = concurrency
+
+    with requests.post(f"{api_url}/ask/batch", json=payload, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions via /ask/batch.")
+    parser.add_argument("questions", help="file with one question per line, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSON lines output file (default: stdout)")
+    parser.add_argument("--allow-fallback", action="store_true")
+    parser.add_argument("--concurrency", type=int, help="max parallel LLM calls (capped by the server)")
+    parser.add_argument("--api-url", default=API_URL)
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    if not questions:
+        print("No questions found.", file=sys.stderr)
+        return
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    start_time = time.time()
+    errors = 0
+    with out:
+        for result in ask_batch(questions, args.allow_fallback, args.concurrency, args.api_url):
+            errors += "error" in result
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+
+    elapsed = time.time() - start_time
+    print(
+        f"Answered {len(questions)} questions in {elapsed:.1f}s "
+        f"({len(questions) / elapsed:.2f} q/s, {errors} errors)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+SQLite storage layer throughput on a large corpus.
+
+Ingests `--chunks` synthetic chunks (1M by default) in documents of
+`--chunks-per-doc`, comparing the bulk add_doc against the previous
+row-at-a-time insert on a sample, then measures chunk lookups by id, doc
+deletes (cascading through chunks and the FTS index) and lookup latency while
+another thread keeps ingesting (WAL lets readers proceed).
+
+    uv run benchmarks/bench_db.py --chunks 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# Point storage at a scratch directory before the backend reads its config
+_tmp = tempfile.mkdtemp(prefix="bench_db_")
+os.environ["DATABASE_FILE"] = os.path.join(_tmp, "metadata.db")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from db import init_db, add_doc, remove_doc, get_chunks_by_ids, count_chunks  # noqa: E402
+
+WORDS = (
+    "the component assembly failed inspection during quarterly review and the supplier "
+    "report lists corrective actions for the housing valve sensor bracket firmware"
+).split()
+
+
+def make_chunks(rng, n, words):
+    return [" ".join(rng.choice(WORDS) for _ in range(words)) for _ in range(n)]
+
+
+def legacy_add_doc(path, filename, chunks):
+    """The previous implementation: new connection, one INSERT per chunk."""
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    cur.execute("INSERT OR IGNORE INTO docs(filename) VALUES (?)", (filename,))
+    doc_id = cur.execute("SELECT id FROM docs WHERE filename=?", (filename,)).fetchone()[0]
+    for c in chunks:
+        cur.execute("INSERT INTO chunks(doc_id, text) VALUES (?, ?)", (doc_id, c))
+    conn.commit()
+    conn.close()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples) * 1000, samples[int(0.95 * (len(samples) - 1))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--chunks-per-doc", type=int, default=1000)
+    parser.add_argument("--words", type=int, default=60)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    init_db()
+    rng = random.Random(0)
+    n_docs = args.chunks // args.chunks_per_doc
+
+    # Row-at-a-time baseline on a sample of docs
+    sample_docs = max(1, min(20, n_docs // 10))
+    start = time.perf_counter()
+    for d in range(sample_docs):
+        legacy_add_doc(os.environ["DATABASE_FILE"], f"legacy_{d}.pdf", make_chunks(rng, args.chunks_per_doc, args.words))
+    legacy_rate = sample_docs * args.chunks_per_doc / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    insert_time = 0.0
+    for d in range(n_docs):
+        chunks = make_chunks(rng, args.chunks_per_doc, args.words)
+        t = time.perf_counter()
+        add_doc(f"report_{d}.pdf", chunks)
+        insert_time += time.perf_counter() - t
+    total = time.perf_counter() - start
+    n = count_chunks()
+    print(f"{n} chunks in {n_docs + sample_docs} docs, DB {os.path.getsize(os.environ['DATABASE_FILE']) / 1e6:.0f} MB")
+    print(f"ingest: bulk add_doc {n_docs * args.chunks_per_doc / insert_time:,.0f} chunks/s "
+          f"(row-at-a-time {legacy_rate:,.0f} chunks/s), wall {total:.1f}s incl. text generation")
+
+    max_id = n
+    lookups = []
+    for _ in range(args.lookups):
+        ids = [rng.randint(1, max_id) for _ in range(5)]
+        t = time.perf_counter()
+        get_chunks_by_ids(ids)
+        lookups.append(time.perf_counter() - t)
+    print("lookup 5 chunks by id: p50 {:.3f} ms, p95 {:.3f} ms".format(*percentiles(lookups)))
+
+    deletes = []
+    for d in rng.sample(range(n_docs), min(20, n_docs)):
+        t = time.perf_counter()
+        remove_doc(f"report_{d}.pdf")
+        deletes.append(time.perf_counter() - t)
+    print("delete doc ({} chunks, cascades to FTS): p50 {:.1f} ms, p95 {:.1f} ms".format(
+        args.chunks_per_doc, *percentiles(deletes)))
+
+    # Readers during ingestion
+    stop = threading.Event()
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            add_doc(f"concurrent_{i}.pdf", make_chunks(random.Random(i), args.chunks_per_doc, args.words))
+            i += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    during = []
+    for _ in range(args.lookups):
+        ids = [rng.randint(1, max_id) for _ in range(5)]
+        t = time.perf_counter()
+        get_chunks_by_ids(ids)
+        during.append(time.perf_counter() - t)
+    stop.set()
+    thread.join()
+    print("lookup during ingestion: p50 {:.3f} ms, p95 {:.3f} ms".format(*percentiles(during)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+What upload deduplication saves in index size and ingest time.
+
+Generates a corpus whose files share boilerplate pages, then ingests it three
+times through the bulk path: the originals, the same files again (an unchanged
+re-upload) and copies under new names. "legacy" runs with content hashing and
+page dedup disabled, which is how every re-upload used to add a full copy of
+its chunks; "dedup" is the current behaviour. Each mode runs in its own
+process on a scratch data directory.
+
+    uv run benchmarks/bench_dedup.py --files 100 --pages 10 --boilerplate 2
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCH_DIR, "..", "backend")
+PHASES = ["initial", "re-upload", "copies"]
+
+
+def run_phases(corpus_dir, legacy):
+    """Child process: ingest the corpus once per phase and report sizes and times."""
+    sys.path.insert(0, BACKEND_DIR)
+    from config import DATABASE_FILE
+    import ingest
+    from db import init_db, count_chunks
+    from index import index_path
+    from jobs import Job
+
+    if legacy:
+        ingest.skip_reason = lambda filename, content_hash: None
+    init_db()
+    data_dir = os.environ["DATA_DIR"]
+    names = sorted(os.listdir(corpus_dir))
+    results = []
+    for phase in PHASES:
+        paths = []
+        for name in names:
+            # Legacy re-uploads appended a copy of every chunk; fresh names reproduce that here
+            dest_name = name if phase == "initial" or (phase == "re-upload" and not legacy) else f"{phase}_{name}"
+            dest = os.path.join(data_dir, dest_name)
+            shutil.copy(os.path.join(corpus_dir, name), dest)
+            paths.append(dest)
+        start = time.perf_counter()
+        result = ingest.ingest_files(Job("bulk_ingest", ingest.BULK_INGEST_STAGES), paths)
+        results.append({
+            "phase": phase,
+            "seconds": time.perf_counter() - start,
+            "chunks_added": result["chunks_added"],
+            "pages_skipped": result["pages_skipped"],
+            "files_skipped": len(result["files_skipped"]),
+            "vectors": count_chunks(),
+            "index_mb": os.path.getsize(index_path()) / 1e6,
+            "db_mb": os.path.getsize(DATABASE_FILE) / 1e6,
+        })
+    print(json.dumps(results))
+
+
+def run_mode(corpus_dir, legacy):
+    scratch = tempfile.mkdtemp(prefix="bench_dedup_")
+    env = {
+        **os.environ,
+        "DATABASE_FILE": os.path.join(scratch, "metadata.db"),
+        "EMBEDDING_DIR": os.path.join(scratch, "embeddings"),
+        "DATA_DIR": os.path.join(scratch, "documents"),
+        "DEDUP_PAGES": "False" if legacy else "True",
+    }
+    os.makedirs(env["DATA_DIR"])
+    try:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", corpus_dir] + (["--legacy"] if legacy else []),
+            env=env, cwd=BACKEND_DIR, check=True, capture_output=True, text=True,
+        ).stdout
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=8, help="content pages per file")
+    parser.add_argument("--boilerplate", type=int, default=2, help="shared boilerplate pages per file")
+    parser.add_argument("--words", type=int, default=400, help="words per page")
+    parser.add_argument("--child", metavar="CORPUS_DIR", help=argparse.SUPPRESS)
+    parser.add_argument("--legacy", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_phases(args.child, args.legacy)
+        return
+
+    sys.path.insert(0, BENCH_DIR)
+    from corpus import make_corpus
+
+    corpus_dir = tempfile.mkdtemp(prefix="bench_dedup_corpus_")
+    try:
+        make_corpus(corpus_dir, args.files, args.pages, args.words, boilerplate_pages=args.boilerplate)
+        modes = {"legacy": run_mode(corpus_dir, legacy=True), "dedup": run_mode(corpus_dir, legacy=False)}
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    print(f"{args.files} files x ({args.pages} pages + {args.boilerplate} boilerplate), ingested 3 times")
+    print(f"{'mode':>7} {'phase':>10} {'seconds':>8} {'chunks':>7} {'pages skipped':>14} "
+          f"{'vectors':>8} {'index MB':>9} {'db MB':>7}")
+    for mode, results in modes.items():
+        for r in results:
+            print(f"{mode:>7} {r['phase']:>10} {r['seconds']:>8.2f} {r['chunks_added']:>7} {r['pages_skipped']:>14} "
+                  f"{r['vectors']:>8} {r['index_mb']:>9.2f} {r['db_mb']:>7.2f}")
+    legacy, dedup = modes["legacy"], modes["dedup"]
+    print(
+        f"Final index: {dedup[-1]['index_mb']:.2f} MB vs {legacy[-1]['index_mb']:.2f} MB "
+        f"({1 - dedup[-1]['index_mb'] / legacy[-1]['index_mb']:.0%} smaller); total ingest time "
+        f"{sum(r['seconds'] for r in dedup):.1f}s vs {sum(r['seconds'] for r in legacy):.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Query-embedding throughput and latency under concurrent load.
+
+Compares the old path (every request thread calls model.encode on its own
+query) with the micro-batching QueryBatcher, at several concurrency levels.
+Uses the configured EMBEDDING_MODEL / EMBEDDING_BACKEND.
+
+    uv run benchmarks/bench_embeddings.py --concurrency 1 4 16 32 --queries 512
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Point storage at a scratch directory before the backend reads its config
+_tmp = tempfile.mkdtemp(prefix="bench_embeddings_")
+os.environ["DATABASE_FILE"] = os.path.join(_tmp, "metadata.db")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from embeddings import QueryBatcher, get_model, model_id  # noqa: E402
+
+WORDS = "what which how does the report policy risk revenue growth model data finding method 2023 region".split()
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+
+def direct(text):
+    """The pre-batching path: one encode call per request."""
+    return get_model().encode([text], convert_to_numpy=True)[0]
+
+
+def run(embed, queries, concurrency):
+    latencies = []
+
+    def one(text):
+        start = time.perf_counter()
+        embed(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, queries))
+    elapsed = time.perf_counter() - start
+    return len(queries) / elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--queries", type=int, default=512)
+    parser.add_argument("--words", type=int, default=12)
+    parser.add_argument("--wait-ms", type=float, default=2)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    queries = [" ".join(rng.choice(WORDS) for _ in range(args.words)) + f" #{i}" for i in range(args.queries)]
+    get_model().encode(["warm-up"], convert_to_numpy=True)
+    print(f"model: {model_id()}")
+
+    for concurrency in args.concurrency:
+        batcher = QueryBatcher(max_wait_ms=args.wait_ms)
+        for name, embed in [("direct", direct), ("batched", lambda t: batcher.embed([t])[0])]:
+            qps, latencies = run(embed, queries, concurrency)
+            extra = f"  avg batch {batcher.stats()['avg_batch']:.1f}" if name == "batched" else ""
+            print(
+                f"c={concurrency:<3} {name:>8}: {qps:8.1f} q/s  "
+                f"p50={statistics.median(latencies):.2f} ms p95={percentile(latencies, 95):.2f} ms{extra}"
+            )
+
+
+if __name__ == "__main__":
+    main()
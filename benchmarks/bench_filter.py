@@ -0,0 +1,91 @@
+"""
+Document-filtered vector search.
+
+Builds an index over random unit vectors spread over many documents, then
+searches restricted to 1, 10 and 100 documents with search_subset, for each
+index type. Reports latency and recall@k against brute force over the subset.
+The baseline is the unfiltered search followed by post-filtering, which
+returns fewer than k hits whenever the subset is small.
+
+    uv run benchmarks/bench_filter.py --chunks 200000 --docs 2000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import numpy as np  # noqa: E402
+
+from config import FILTER_EXACT_MAX  # noqa: E402
+from index import INDEX_TYPES, create_index, search_subset  # noqa: E402
+
+
+def unit(rows):
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def brute_force(vectors, ids, q, k):
+    d = ((vectors - q) ** 2).sum(1)
+    return set(ids[np.argsort(d)[:k]].tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--exact-max", type=int, default=FILTER_EXACT_MAX)
+    parser.add_argument("--subsets", type=int, nargs="+", default=[1, 10, 100], help="documents per filter")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = unit(rng.standard_normal((args.chunks, args.dim)).astype("float32"))
+    ids = np.arange(1, args.chunks + 1, dtype="int64")
+    # Chunks of a document sit around a shared topic vector, like real text does
+    doc_of = rng.integers(0, args.docs, args.chunks)
+    topics = unit(rng.standard_normal((args.docs, args.dim)).astype("float32"))
+    vectors = unit(topics[doc_of] + 0.6 * vectors)
+    queries = unit(topics[rng.integers(0, args.docs, args.queries)]
+                   + 0.6 * unit(rng.standard_normal((args.queries, args.dim)).astype("float32")))
+
+    print(f"{args.chunks} chunks in {args.docs} docs, k={args.top_k}")
+    print(f"{'index':>9} {'docs':>5} {'chunks':>7} {'filtered ms':>12} {'recall':>7} {'post-filter ms':>15} {'full k':>7}")
+    for index_type in INDEX_TYPES:
+        index = create_index(vectors, ids, index_type, train_threshold=0)
+        for n_docs in args.subsets:
+            chosen = rng.choice(args.docs, n_docs, replace=False)
+            mask = np.isin(doc_of, chosen)
+            subset = ids[mask]
+
+            times, recalls = [], []
+            for q in queries:
+                start = time.perf_counter()
+                _, found = search_subset(index, q[None, :], args.top_k, subset, args.exact_max)
+                times.append((time.perf_counter() - start) * 1000)
+                truth = brute_force(vectors[mask], subset, q, args.top_k)
+                recalls.append(len(truth & set(found[0].tolist())) / len(truth))
+
+            # Baseline: global top-k, then drop hits outside the subset
+            post_times, full = [], 0
+            subset_set = set(subset.tolist())
+            for q in queries:
+                start = time.perf_counter()
+                _, found = index.search(q[None, :], args.top_k)
+                hits = [i for i in found[0] if i in subset_set]
+                post_times.append((time.perf_counter() - start) * 1000)
+                full += len(hits) == min(args.top_k, len(subset))
+
+            print(
+                f"{index_type:>9} {n_docs:>5} {len(subset):>7} {statistics.median(times):>12.3f} "
+                f"{statistics.fmean(recalls):>7.2f} {statistics.median(post_times):>15.3f} "
+                f"{full / len(queries):>7.0%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Retrieval quality and latency per retrieval mode (vector / lexical / hybrid).
+
+Generates a synthetic corpus where every chunk carries a unique part number
+(e.g. "PN-48213-KX") inside generic report text, embeds it with the configured
+embedding model and indexes it, then asks one question per sampled chunk that
+mentions only its part number. Reports hit@k, MRR and p50/p95 latency.
+
+    uv run benchmarks/bench_hybrid.py --chunks 5000 --queries 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Point storage at a scratch directory before the backend reads its config
+_tmp = tempfile.mkdtemp(prefix="bench_hybrid_")
+os.environ["DATA_DIR"] = os.path.join(_tmp, "documents")
+os.environ["EMBEDDING_DIR"] = os.path.join(_tmp, "embeddings")
+os.environ["DATABASE_FILE"] = os.path.join(_tmp, "metadata.db")
+os.makedirs(os.environ["EMBEDDING_DIR"], exist_ok=True)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from db import init_db, add_doc  # noqa: E402
+from embeddings import build_embeddings, model_id  # noqa: E402
+from index import build_index  # noqa: E402
+from retrieval import RETRIEVAL_MODES, retrieve_chunks  # noqa: E402
+
+WORDS = (
+    "the component assembly failed inspection during quarterly review and the supplier "
+    "report lists corrective actions for the housing valve sensor bracket firmware"
+).split()
+
+
+def part_number(rng):
+    letters = "ABCDEFGHJKLMNPQRSTUVWXYZ"
+    return f"PN-{rng.randint(10000, 99999)}-{rng.choice(letters)}{rng.choice(letters)}"
+
+
+def populate(n_chunks, words_per_chunk, chunks_per_doc=50):
+    rng = random.Random(0)
+    ids, texts, parts = [], [], []
+    for d in range(0, n_chunks, chunks_per_doc):
+        batch, batch_parts = [], []
+        for _ in range(min(chunks_per_doc, n_chunks - d)):
+            pn = part_number(rng)
+            words = [rng.choice(WORDS) for _ in range(words_per_chunk)]
+            words.insert(rng.randrange(len(words)), pn)
+            batch.append(" ".join(words))
+            batch_parts.append(pn)
+        ids += add_doc(f"report_{d // chunks_per_doc}.pdf", batch)
+        texts += batch
+        parts += batch_parts
+    build_index(ids, build_embeddings(texts), model_id())
+    return ids, parts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--words", type=int, default=120)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    init_db()
+    ids, parts = populate(args.chunks, args.words)
+    rng = random.Random(1)
+    targets = rng.sample(range(len(ids)), min(args.queries, len(ids)))
+
+    print(f"{args.chunks} chunks, {len(targets)} part-number queries, top-{args.top_k}")
+    print(f"{'mode':>8} {'hit@k':>7} {'MRR':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode in RETRIEVAL_MODES:
+        hits, rr, latencies = 0, 0.0, []
+        for t in targets:
+            question = f"What corrective action was taken for part {parts[t]}?"
+            start = time.perf_counter()
+            results = retrieve_chunks(question, args.top_k, mode=mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found = [r["id"] for r in results]
+            if ids[t] in found:
+                hits += 1
+                rr += 1.0 / (found.index(ids[t]) + 1)
+        latencies.sort()
+        print(
+            f"{mode:>8} {hits / len(targets):>7.3f} {rr / len(targets):>7.3f} "
+            f"{statistics.median(latencies):>8.2f} {latencies[int(0.95 * (len(latencies) - 1))]:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
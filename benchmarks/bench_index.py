@@ -0,0 +1,86 @@
+"""
+Recall/latency benchmark for the configurable FAISS index types.
+
+Builds each index type over a synthetic clustered corpus, measures build
+time, recall@k against the exact flat index and single-query latency.
+
+    uv run benchmarks/bench_index.py --sizes 10000,100000 --types flat,ivf_flat,ivf_pq,hnsw
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import numpy as np  # noqa: E402
+
+from index import INDEX_TYPES, create_index  # noqa: E402
+
+
+def synthetic_corpus(n, dim, n_queries, n_clusters=256, seed=0):
+    """Unit vectors drawn around random centroids, roughly like sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(n_clusters, dim)).astype("float32")
+    assign = rng.integers(0, n_clusters, size=n + n_queries)
+    data = centroids[assign] + 0.5 * rng.normal(size=(n + n_queries, dim)).astype("float32")
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    return data[:n], data[n:]
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int)
+    parser.add_argument("--ef-search", type=int)
+    args = parser.parse_args()
+
+    # Always train IVF in the benchmark, whatever the threshold in config
+    overrides = {"train_threshold": 0}
+    if args.nprobe:
+        overrides["nprobe"] = args.nprobe
+    if args.ef_search:
+        overrides["ef_search"] = args.ef_search
+
+    print(f"{'size':>9} {'type':>9} {'build s':>8} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for n in [int(s) for s in args.sizes.split(",")]:
+        vectors, queries = synthetic_corpus(n, args.dim, args.queries)
+        ids = np.arange(n, dtype="int64")
+        truth = None
+
+        for index_type in args.types.split(","):
+            start = time.perf_counter()
+            index = create_index(vectors, ids, index_type, **overrides)
+            build_time = time.perf_counter() - start
+
+            latencies, found = [], []
+            for q in queries:
+                t0 = time.perf_counter()
+                _, hit_ids = index.search(q.reshape(1, -1), args.top_k)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                found.append(hit_ids[0])
+            found = np.array(found)
+
+            if truth is None:
+                exact = create_index(vectors, ids, "flat")
+                truth = exact.search(queries, args.top_k)[1]
+
+            latencies.sort()
+            print(
+                f"{n:>9} {index_type:>9} {build_time:>8.2f} {recall_at_k(found, truth):>9.3f} "
+                f"{statistics.median(latencies):>8.3f} {latencies[int(0.95 * (len(latencies) - 1))]:>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
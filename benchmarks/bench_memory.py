@@ -0,0 +1,96 @@
+"""
+Per-worker memory benchmark for index storage options.
+
+Writes a synthetic index for each index type and quantization, then starts several worker
+processes that load it (optionally memory-mapped) and run queries while all
+are alive, reporting each worker's private (anonymous) RSS, file-backed RSS
+and PSS, i.e. its fair share of pages shared with the other workers.
+
+    uv run benchmarks/bench_memory.py --vectors 200000 --workers 4 --index-types flat,ivf_flat
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+
+# Workers are spawned and re-import this module, so share the directory via env
+os.environ.setdefault("EMBEDDING_DIR", tempfile.mkdtemp(prefix="bench_memory_"))
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import numpy as np  # noqa: E402
+
+from index import create_index, load_index, publish_index  # noqa: E402
+
+
+def memory_kb():
+    """RssAnon / RssFile from /proc/self/status and Pss from smaps_rollup (Linux)."""
+    stats = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key = line.split(":")[0]
+            if key in ("RssAnon", "RssFile"):
+                stats[key] = int(line.split()[1])
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                stats["Pss"] = int(line.split()[1])
+    return stats
+
+
+def worker(mmap, dim, n_queries, barrier, results):
+    base = memory_kb()
+    index = load_index(mmap=mmap)
+    queries = np.random.default_rng(os.getpid()).random((n_queries, dim), dtype="float32")
+    index.search(queries, 5)
+    barrier.wait()  # every worker is resident before measuring shared pages
+    after = memory_kb()
+    results.put({k: after[k] - base.get(k, 0) for k in after})
+    barrier.wait()
+
+
+def measure(mmap, workers, dim, n_queries):
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(mmap, dim, n_queries, barrier, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    samples = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return {k: sum(s[k] for s in samples) / len(samples) / 1024 for k in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--quantizations", default="none,fp16,sq8")
+    parser.add_argument("--index-types", default="flat,ivf_flat,ivf_pq")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.vectors, args.dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = np.arange(args.vectors, dtype="int64")
+
+    print(f"{args.vectors} x {args.dim} vectors, {args.workers} workers; MiB per worker")
+    print(f"{'index':>8} {'storage':>8} {'mmap':>5} {'anon':>8} {'file':>8} {'pss':>8}")
+    for index_type in args.index_types.split(","):
+        # IVF-PQ is already compressed and ignores the quantization
+        quantizations = ["none"] if index_type == "ivf_pq" else args.quantizations.split(",")
+        for quantization in quantizations:
+            index = create_index(vectors, ids, index_type, quantization=quantization, train_threshold=0)
+            publish_index(index, "synthetic")
+            for mmap in (False, True):
+                m = measure(mmap, args.workers, args.dim, args.queries)
+                print(f"{index_type:>8} {quantization:>8} {str(mmap):>5} "
+                      f"{m['RssAnon']:>8.1f} {m['RssFile']:>8.1f} {m['Pss']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
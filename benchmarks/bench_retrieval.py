@@ -0,0 +1,96 @@
+"""
+Retrieval latency benchmark (no LLM, no embedding model calls).
+
+Compares the old per-request path (read the FAISS file + load every chunk)
+with the resident Retriever (index kept in memory, top-k rows fetched by id).
+
+    uv run benchmarks/bench_retrieval.py --chunks 20000 --queries 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Point storage at a scratch directory before the backend reads its config
+_tmp = tempfile.mkdtemp(prefix="bench_retrieval_")
+os.environ["DATA_DIR"] = os.path.join(_tmp, "documents")
+os.environ["EMBEDDING_DIR"] = os.path.join(_tmp, "embeddings")
+os.environ["DATABASE_FILE"] = os.path.join(_tmp, "metadata.db")
+os.makedirs(os.environ["EMBEDDING_DIR"], exist_ok=True)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import faiss  # noqa: E402
+import numpy as np  # noqa: E402
+
+from db import init_db, add_doc, get_all_chunks  # noqa: E402
+from index import build_index, index_path  # noqa: E402
+from retrieval import Retriever  # noqa: E402
+
+WORDS = "research report analysis finding result method data system model policy".split()
+
+
+def populate(n_chunks, dim, words_per_chunk, chunks_per_doc=100):
+    rng = random.Random(0)
+    chunk_ids = []
+    for d in range(0, n_chunks, chunks_per_doc):
+        texts = [
+            " ".join(rng.choice(WORDS) for _ in range(words_per_chunk))
+            for _ in range(min(chunks_per_doc, n_chunks - d))
+        ]
+        chunk_ids += add_doc(f"doc_{d // chunks_per_doc}.pdf", texts)
+    vectors = np.random.default_rng(0).random((len(chunk_ids), dim), dtype="float32")
+    build_index(chunk_ids, vectors, "synthetic")
+
+
+def baseline_search(q_emb, top_k):
+    """The pre-Retriever path: read index and every chunk on each call."""
+    index = faiss.read_index(index_path())
+    distances, ids = index.search(q_emb, top_k)
+    chunks = {c["id"]: c for c in get_all_chunks()}
+    return [chunks[int(i)] for i in ids[0] if int(i) in chunks]
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+
+def timed(fn, queries, top_k):
+    samples = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q, top_k)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--words", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    init_db()
+    populate(args.chunks, args.dim, args.words)
+
+    rng = np.random.default_rng(1)
+    queries = [rng.random((1, args.dim), dtype="float32") for _ in range(args.queries)]
+    retriever = Retriever()
+
+    for name, fn in [("baseline", baseline_search), ("retriever", retriever.search)]:
+        samples = timed(fn, queries, args.top_k)
+        print(
+            f"{name:>10}: p50={statistics.median(samples):.2f} ms "
+            f"p95={percentile(samples, 95):.2f} ms  ({args.chunks} chunks)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Backend cold-start time.
+
+Runs fresh interpreters (so nothing is cached in-process) and reports, as the
+median of `--runs`: the time to import the app (what blocks the server from
+accepting requests), the time until /readyz would pass (import + warm-up of
+the embedding model and FAISS index), and the import cost of each heavy
+dependency that is now loaded lazily.
+
+    uv run benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+APP_PROBE = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+from startup import warm_up
+warm_up()
+ready = time.perf_counter()
+print(json.dumps({"import": imported - start, "ready": ready - start}))
+"""
+
+MODULE_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+__import__(sys.argv[1])
+print(json.dumps({"import": time.perf_counter() - start}))
+"""
+
+HEAVY_MODULES = ["torch", "sentence_transformers", "faiss", "tiktoken", "PyPDF2", "docx"]
+
+
+def run_probe(code, *args, env=None):
+    out = subprocess.run(
+        [sys.executable, "-c", code, *args],
+        cwd=BACKEND, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_startup_")
+    env = {
+        **os.environ,
+        "DATA_DIR": os.path.join(tmp, "documents"),
+        "EMBEDDING_DIR": os.path.join(tmp, "embeddings"),
+        "DATABASE_FILE": os.path.join(tmp, "metadata.db"),
+    }
+    # Warm the OS page cache so every run measures the same thing
+    run_probe(APP_PROBE, env=env)
+
+    runs = [run_probe(APP_PROBE, env=env) for _ in range(args.runs)]
+    print(f"median of {args.runs} cold interpreter starts")
+    print(f"{'import app':>24} {statistics.median(r['import'] for r in runs) * 1000:>8.0f} ms")
+    print(f"{'ready (with warm-up)':>24} {statistics.median(r['ready'] for r in runs) * 1000:>8.0f} ms")
+    print("lazily imported dependencies:")
+    for module in HEAVY_MODULES:
+        times = [run_probe(MODULE_PROBE, module, env=env)["import"] for _ in range(args.runs)]
+        print(f"{module:>24} {statistics.median(times) * 1000:>8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""
+End-to-end performance suite, fully offline.
+
+1. Generates a synthetic PDF/DOCX corpus (benchmarks/corpus.py).
+2. Starts a stub OpenAI-compatible LLM (benchmarks/stub_llm.py) with the
+   given time to first token and per-word streaming delay.
+3. Starts the production server (gunicorn, preloaded app) against a scratch
+   data directory and measures:
+   - ingestion: POST /docs/bulk until the job finishes (files/pages/chunks per s)
+   - index build: POST /index/rebuild, until its generation is published (embeddings come from the cache)
+   - retrieval: p50/p95/p99 per retrieval mode, in-process, plus hit rate
+     (the planted fact's file is among the top-k chunks)
+   - /ask and /ask/stream at each concurrency level: req/s, latency
+     percentiles, time to first token and the server's per-stage timings
+
+Results are written as JSON; pass --compare to diff against an earlier run.
+
+    uv run benchmarks/bench_suite.py --files 50 --concurrency 1 8 32 --output bench.json
+    uv run benchmarks/bench_suite.py --output new.json --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+# Point storage at a scratch directory before the backend reads its config
+_tmp = tempfile.mkdtemp(prefix="bench_suite_")
+os.environ["DATA_DIR"] = os.path.join(_tmp, "documents")
+os.environ["EMBEDDING_DIR"] = os.path.join(_tmp, "embeddings")
+os.environ["DATABASE_FILE"] = os.path.join(_tmp, "metadata.db")
+os.makedirs(os.environ["DATA_DIR"], exist_ok=True)
+os.makedirs(os.environ["EMBEDDING_DIR"], exist_ok=True)
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import make_corpus  # noqa: E402
+import stub_llm  # noqa: E402
+
+RETRIEVAL_MODES = ["vector", "lexical", "hybrid"]
+# Relative change beyond which --compare flags a metric
+REGRESSION_THRESHOLD = 0.10
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(samples):
+    """p50/p95/p99/mean in milliseconds of samples given in seconds."""
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    ordered = sorted(samples)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {"p50_ms": pick(50), "p95_ms": pick(95), "p99_ms": pick(99), "mean_ms": statistics.fmean(ordered) * 1000}
+
+
+def start_server(llm_url, workers):
+    port = free_port()
+    env = {
+        **os.environ,
+        "WEB_WORKERS": str(workers),
+        "WEB_BIND": f"127.0.0.1:{port}",
+        "LMSTUDIO_API_URL": llm_url,
+        "ANSWER_CACHE_SIZE": "0",  # measure the full pipeline on every request
+        "LLM_MAX_INFLIGHT": "64",
+        "LLM_MAX_QUEUE": "1024",
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+        cwd=os.path.join(ROOT, "backend"), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(600):
+        try:
+            if requests.get(f"{url}/readyz", timeout=1).ok:
+                return proc, url
+        except requests.RequestException:
+            pass
+        if proc.poll() is not None:
+            break
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not come up")
+
+
+def wait_for_job(url, job_id, timeout=3600):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = requests.get(f"{url}/jobs/{job_id}").json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.1)
+    raise RuntimeError(f"Job {job_id} did not finish")
+
+
+# ---------------------------
+# Stages
+# ---------------------------
+def bench_ingest(url, paths, pages_per_file):
+    files = [("files", (os.path.basename(p), open(p, "rb"))) for p in paths]
+    start = time.perf_counter()
+    try:
+        response = requests.post(f"{url}/docs/bulk", files=files)
+    finally:
+        for _, (_, f) in files:
+            f.close()
+    response.raise_for_status()
+    job = wait_for_job(url, response.json()["job_id"])
+    elapsed = time.perf_counter() - start
+    if job["status"] != "done":
+        raise RuntimeError(f"Ingestion failed: {job['error']}")
+    result = job["result"]
+    stages = {
+        stage: t["finished_at"] - t["started_at"]
+        for stage, t in job["stage_times"].items()
+        if "finished_at" in t
+    }
+    return {
+        "files": result["files_ingested"],
+        "files_failed": len(result["files_failed"]),
+        "chunks": result["chunks_added"],
+        "seconds": elapsed,
+        "files_per_sec": len(paths) / elapsed,
+        "pages_per_sec": len(paths) * pages_per_file / elapsed,
+        "chunks_per_sec": result["chunks_added"] / elapsed,
+        "stage_seconds": stages,
+    }
+
+
+def bench_index_build(url):
+    start = time.perf_counter()
+    response = requests.post(f"{url}/index/rebuild")
+    response.raise_for_status()
+    job = wait_for_job(url, response.json()["job_id"])
+    if job["status"] != "done":
+        raise RuntimeError(f"Index rebuild failed: {job['error']}")
+    return {"seconds": time.perf_counter() - start, "vectors": job["result"]["vectors"]}
+
+
+def bench_retrieval(queries, rounds, top_k):
+    """In-process retrieval latency per mode (no LLM), including the query embedding."""
+    from retrieval import retrieve_chunks
+
+    results = {}
+    for mode in RETRIEVAL_MODES:
+        retrieve_chunks(queries[0]["question"], top_k, mode=mode)  # load model/index
+        samples, hits = [], 0
+        for _ in range(rounds):
+            for q in queries:
+                start = time.perf_counter()
+                chunks = retrieve_chunks(q["question"], top_k, mode=mode)
+                samples.append(time.perf_counter() - start)
+                hits += any(c["source"] == q["filename"] for c in chunks)
+        results[mode] = {**percentiles(samples), "queries": len(samples), "hit_rate": hits / len(samples)}
+    return results
+
+
+def drive_ask(url, queries, clients, duration, stream):
+    """Closed-loop load: `clients` threads ask back to back for `duration` seconds."""
+    latencies, first_tokens, errors, stage_times = [], [], 0, {}
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def ask(session, question):
+        start = time.perf_counter()
+        if not stream:
+            r = session.post(f"{url}/ask", json={"question": question})
+            body = r.json() if r.ok else {}
+            return r.ok, time.perf_counter() - start, None, body.get("timings", {})
+        first, timings, ok = None, {}, False
+        with session.post(f"{url}/ask/stream", json={"question": question}, stream=True) as r:
+            event = None
+            for line in r.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line.split(":", 1)[1].strip()
+                elif line.startswith("data:"):
+                    if event == "token" and first is None:
+                        first = time.perf_counter() - start
+                    elif event == "done":
+                        ok = True
+                        timings = json.loads(line[len("data:"):]).get("timings", {})
+                    elif event == "error":
+                        break
+        return ok, time.perf_counter() - start, first, timings
+
+    def client(n):
+        session = requests.Session()
+        i = 0
+        nonlocal errors
+        while time.time() < deadline:
+            # Unique question text, so no request is served from a cache
+            q = queries[(n + i) % len(queries)]["question"] + f" ({n}.{i})"
+            i += 1
+            try:
+                ok, elapsed, first, timings = ask(session, q)
+            except requests.RequestException:
+                ok, elapsed, first, timings = False, 0.0, None, {}
+            with lock:
+                if not ok:
+                    errors += 1
+                    continue
+                latencies.append(elapsed)
+                if first is not None:
+                    first_tokens.append(first)
+                for stage, seconds in timings.items():
+                    stage_times.setdefault(stage, []).append(seconds)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    result = {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": errors,
+        "req_per_sec": len(latencies) / duration,
+        **percentiles(latencies),
+        "stage_mean_ms": {stage: statistics.fmean(v) * 1000 for stage, v in stage_times.items()},
+    }
+    if stream:
+        result["first_token"] = percentiles(first_tokens)
+    return result
+
+
+# ---------------------------
+# Reporting
+# ---------------------------
+def flatten(data, prefix=""):
+    """{"a": {"b": 1}} -> {"a.b": 1} for numeric leaves."""
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def higher_is_better(metric):
+    return metric.endswith(("_per_sec", "hit_rate"))
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Print metrics that moved by more than `threshold`, marking regressions."""
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    regressions = 0
+    for metric in sorted(old.keys() & new.keys()):
+        if not metric.endswith(("_ms", "_per_sec", "seconds", "hit_rate")) or not old[metric]:
+            continue
+        change = (new[metric] - old[metric]) / old[metric]
+        if abs(change) < threshold:
+            continue
+        worse = change < 0 if higher_is_better(metric) else change > 0
+        regressions += worse
+        flag = "REGRESSION" if worse else "improved"
+        print(f"{metric:<50} {old[metric]:>12.2f} -> {new[metric]:>12.2f} ({change:+.0%}) {flag}")
+    print(f"{regressions} regression(s) beyond {threshold:.0%}")
+    return regressions
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    settings = ["EMBEDDING_MODEL", "EMBEDDING_BACKEND", "INDEX_TYPE", "INDEX_QUANTIZATION", "RETRIEVAL_MODE",
+                "CHUNK_SIZE", "TOP_K", "RERANK_ENABLED"]
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {name: os.environ[name] for name in settings if name in os.environ},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=5, help="pages per file")
+    parser.add_argument("--words", type=int, default=400, help="words per page")
+    parser.add_argument("--docx-share", type=float, default=0.25)
+    parser.add_argument("--llm-delay", type=float, default=0.2, help="stub time to first token, seconds")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="stub seconds per streamed word")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=10, help="seconds per /ask load level")
+    parser.add_argument("--retrieval-rounds", type=int, default=3)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--no-stream", action="store_true", help="skip the /ask/stream runs")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    paths, queries = make_corpus(os.path.join(_tmp, "corpus"), args.files, args.pages, args.words, args.docx_share)
+    llm = stub_llm.serve(delay=args.llm_delay, token_delay=args.token_delay)
+    llm_url = f"http://127.0.0.1:{llm.server_port}/v1/chat/completions"
+
+    results = {}
+    proc, url = start_server(llm_url, args.workers)
+    try:
+        print(f"Ingesting {len(paths)} files ({args.pages} pages each)...")
+        results["ingest"] = bench_ingest(url, paths, args.pages)
+        print(f"  {results['ingest']['files_per_sec']:.1f} files/s, {results['ingest']['chunks_per_sec']:.0f} chunks/s")
+
+        results["index_build"] = bench_index_build(url)
+        print(f"Index rebuild: {results['index_build']['seconds']:.2f}s for {results['index_build']['vectors']} vectors")
+
+        results["retrieval"] = bench_retrieval(queries, args.retrieval_rounds, args.top_k)
+        for mode, r in results["retrieval"].items():
+            print(f"Retrieval {mode:>7}: p50={r['p50_ms']:.2f} p95={r['p95_ms']:.2f} p99={r['p99_ms']:.2f} ms, "
+                  f"hit rate {r['hit_rate']:.0%}")
+
+        endpoints = [("ask", False)] + ([] if args.no_stream else [("ask_stream", True)])
+        for name, stream in endpoints:
+            drive_ask(url, queries, max(args.concurrency), 2, stream)  # warm up every worker
+            results[name] = {}
+            for clients in args.concurrency:
+                r = drive_ask(url, queries, clients, args.duration, stream)
+                results[name][f"c{clients}"] = r
+                ttft = f" ttft p50={r['first_token']['p50_ms']:.0f} ms" if stream and r["requests"] else ""
+                print(f"/{name.replace('_', '/')} c={clients:<3}: {r['req_per_sec']:.1f} req/s "
+                      f"p50={r['p50_ms'] or 0:.0f} p95={r['p95_ms'] or 0:.0f} ms errors={r['errors']}{ttft}")
+    finally:
+        proc.terminate()
+        proc.wait()
+        llm.shutdown()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "params": vars(args),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(baseline, report) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+/ask throughput of the production server (gunicorn, preloaded app) by worker count.
+
+Indexes a synthetic corpus, starts a stub LLM with a fixed generation delay,
+then for each worker count launches `gunicorn -c backend/gunicorn.conf.py`
+and drives /ask with concurrent clients asking unique questions (the answer
+cache is disabled). Reports requests/s, p50/p95 latency and the total PSS of
+the server processes, which stays well below workers x RSS because the model
+and index are shared copy-on-write.
+
+    uv run benchmarks/bench_workers.py --workers 1 2 4 --clients 32 --duration 20
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+# Point storage at a scratch directory before the backend reads its config
+_tmp = tempfile.mkdtemp(prefix="bench_workers_")
+os.environ["DATA_DIR"] = os.path.join(_tmp, "documents")
+os.environ["EMBEDDING_DIR"] = os.path.join(_tmp, "embeddings")
+os.environ["DATABASE_FILE"] = os.path.join(_tmp, "metadata.db")
+os.makedirs(os.environ["DATA_DIR"], exist_ok=True)
+os.makedirs(os.environ["EMBEDDING_DIR"], exist_ok=True)
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_hybrid import populate  # noqa: E402
+from db import init_db  # noqa: E402
+import stub_llm  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def pss_kb(pid):
+    """Proportional set size of a process and its children, in kB."""
+    total = 0
+    pids = [pid]
+    try:
+        pids += [int(p) for p in open(f"/proc/{pid}/task/{pid}/children").read().split()]
+    except OSError:
+        pass
+    for p in pids:
+        try:
+            for line in open(f"/proc/{p}/smaps_rollup"):
+                if line.startswith("Pss:"):
+                    total += int(line.split()[1])
+        except OSError:
+            pass
+    return total
+
+
+def start_server(workers, llm_url):
+    port = free_port()
+    env = {
+        **os.environ,
+        "WEB_WORKERS": str(workers),
+        "WEB_BIND": f"127.0.0.1:{port}",
+        "LMSTUDIO_API_URL": llm_url,
+        "ANSWER_CACHE_SIZE": "0",
+        "LLM_MAX_INFLIGHT": "64",
+        "LLM_MAX_QUEUE": "1024",
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+        cwd=os.path.join(ROOT, "backend"), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(600):
+        try:
+            if requests.get(f"{url}/docs", timeout=1).ok:
+                return proc, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not come up")
+
+
+def drive(url, clients, duration):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def client(n):
+        session = requests.Session()
+        i = 0
+        while time.time() < deadline:
+            i += 1
+            start = time.perf_counter()
+            r = session.post(f"{url}/ask", json={"question": f"What corrective action was taken in case {n}-{i}?"})
+            with lock:
+                (latencies if r.ok else errors).append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--llm-delay", type=float, default=0.05, help="stub generation time, seconds")
+    args = parser.parse_args()
+
+    init_db()
+    populate(args.chunks, 120)
+    llm = stub_llm.serve(delay=args.llm_delay)
+    llm_url = f"http://127.0.0.1:{llm.server_port}/v1/chat/completions"
+
+    print(f"{args.chunks} chunks, {args.clients} clients, {args.duration:.0f}s per run, LLM delay {args.llm_delay}s")
+    print(f"{'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} {'PSS MB':>8}")
+    for workers in args.workers:
+        proc, url = start_server(workers, llm_url)
+        try:
+            drive(url, args.clients, 2)  # warm up every worker
+            latencies, errors = drive(url, args.clients, args.duration)
+            pss = pss_kb(proc.pid) / 1024
+        finally:
+            proc.terminate()
+            proc.wait()
+        latencies.sort()
+        p95 = latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+        print(
+            f"{workers:>7} {len(latencies) / args.duration:>8.1f} "
+            f"{statistics.median(latencies) * 1000 if latencies else 0:>8.1f} {p95 * 1000:>8.1f} "
+            f"{len(errors):>7} {pss:>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
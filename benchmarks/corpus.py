@@ -0,0 +1,133 @@
+"""
+Synthetic PDF/DOCX corpora for offline benchmarks.
+
+Every file is filler text with one planted fact ("Case <id>: the corrective
+action was <action>.") so retrieval quality can be checked alongside speed.
+Optional boilerplate pages (the same text in every file apart from the report
+number) model cover sheets and disclaimers.
+PDFs are written directly (one Helvetica text stream per page) so no PDF
+library is needed; DOCX files use python-docx with a page break per page.
+
+    uv run benchmarks/corpus.py --out /tmp/corpus --files 50 --pages 10
+"""
+import argparse
+import os
+import random
+
+WORDS = (
+    "research report analysis finding result method data system model policy budget "
+    "quarter region growth risk audit review process quality incident supplier contract "
+    "network device firmware update schedule maintenance customer service operations"
+).split()
+ACTIONS = ["a firmware update", "a supplier audit", "a contract review", "staff retraining",
+           "a network upgrade", "a process redesign", "a device recall", "a budget freeze"]
+LINE_WORDS = 12
+
+
+def case_id(i):
+    return f"AB-{1000 + i}"
+
+
+def page_text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """Minimal multi-page PDF with extractable text."""
+    n = len(pages)
+    # Object numbers: 1 catalog, 2 page tree, 3 font, then (page, content) pairs
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    for p, text in enumerate(pages):
+        page_obj, content_obj = 4 + 2 * p, 5 + 2 * p
+        kids.append(f"{page_obj} 0 R")
+        words = text.split()
+        lines = [" ".join(words[i:i + LINE_WORDS]) for i in range(0, len(words), LINE_WORDS)]
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        stream = stream.encode("latin-1")
+        objects[page_obj] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_obj} 0 R >>"
+        ).encode()
+        objects[content_obj] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {n} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for num in sorted(objects):
+        offsets[num] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (num, objects[num])
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for num in sorted(objects):
+        out += b"%010d 00000 n \n" % offsets[num]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_docx(path, pages):
+    from docx import Document
+    from docx.enum.text import WD_BREAK
+
+    document = Document()
+    for p, text in enumerate(pages):
+        paragraph = document.add_paragraph(text)
+        if p < len(pages) - 1:
+            paragraph.add_run().add_break(WD_BREAK.PAGE)
+    document.save(path)
+
+
+def make_corpus(out_dir, n_files=20, pages=5, words_per_page=400, docx_share=0.25, seed=0, boilerplate_pages=0):
+    """
+    Write `n_files` documents into `out_dir`, each followed by `boilerplate_pages`
+    near-identical boilerplate pages.
+    Returns (file paths, queries) where each query is {question, filename, answer}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    boilerplate = [page_text(rng, words_per_page) for _ in range(boilerplate_pages)]
+    paths, queries = [], []
+    for i in range(n_files):
+        ext = "docx" if rng.random() < docx_share else "pdf"
+        filename = f"report_{i}.{ext}"
+        action = rng.choice(ACTIONS)
+        texts = [page_text(rng, words_per_page) for _ in range(pages)]
+        fact_page = rng.randrange(pages)
+        texts[fact_page] += f" Case {case_id(i)}: the corrective action was {action}."
+        texts += [f"Report {i}. {text}" for text in boilerplate]
+        path = os.path.join(out_dir, filename)
+        (write_docx if ext == "docx" else write_pdf)(path, texts)
+        paths.append(path)
+        queries.append({
+            "question": f"What corrective action was taken in case {case_id(i)}?",
+            "filename": filename,
+            "answer": action,
+        })
+    return paths, queries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--words", type=int, default=400, help="words per page")
+    parser.add_argument("--docx-share", type=float, default=0.25)
+    parser.add_argument("--boilerplate", type=int, default=0, help="boilerplate pages per file")
+    args = parser.parse_args()
+    paths, _ = make_corpus(args.out, args.files, args.pages, args.words, args.docx_share,
+                           boilerplate_pages=args.boilerplate)
+    size = sum(os.path.getsize(p) for p in paths)
+    print(f"Wrote {len(paths)} files ({size / 1e6:.1f} MB) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Minimal OpenAI-compatible chat completions server for offline benchmarks.
+Every request is answered after a fixed delay (time to first token); with
+`stream: true` the answer is streamed word by word, `token_delay` apart.
+
+    uv run benchmarks/stub_llm.py --port 1234 --delay 0.05 --token-delay 0.01
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "According to the report, the corrective action was a firmware update [Source: report_0.pdf]."
+
+
+def make_handler(delay, token_delay=0.0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            time.sleep(delay)
+            if body.get("stream"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for word in ANSWER.split(" "):
+                    time.sleep(token_delay)
+                    delta = {"choices": [{"delta": {"content": word + " "}}]}
+                    self.wfile.write(f"data: {json.dumps(delta)}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+                return
+            time.sleep(token_delay * len(ANSWER.split(" ")))
+            payload = json.dumps({"choices": [{"message": {"role": "assistant", "content": ANSWER}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=0, delay=0.05, token_delay=0.0):
+    """Start the stub in a background thread; returns the server (`server.server_port`)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(delay, token_delay))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--delay", type=float, default=0.05, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds per generated word")
+    args = parser.parse_args()
+    server = serve(args.port, args.delay, args.token_delay)
+    print(f"Stub LLM on http://127.0.0.1:{server.server_port}/v1/chat/completions")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from config import DATABASE_FILE  # noqa: E402
+from db import init_db, cleanup_db  # noqa: E402
+from embeddings import model_id  # noqa: E402
+from index import init_index, remove_from_index  # noqa: E402
+from ingest import rebuild_index  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove orphaned chunks from the database and index.")
+    parser.add_argument("--vacuum", action="store_true", help="also compact the database file")
+    args = parser.parse_args()
+
+    init_db()
+    init_index(model_id())
+    size_before = os.path.getsize(DATABASE_FILE)
+    result = cleanup_db(vacuum=args.vacuum)
+
+    orphans = result["orphan_chunks"]
+    if orphans and not remove_from_index(orphans):
+        rebuild_index()
+
+    print(
+        f"Removed {len(orphans)} orphaned chunks, {result['pending_chunks']} chunks of interrupted "
+        f"ingestions and {result['empty_docs']} empty docs."
+    )
+    if args.vacuum:
+        size_after = os.path.getsize(DATABASE_FILE)
+        print(f"Database {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
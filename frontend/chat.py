@@ -9,12 +9,66 @@ import time
 # Backend configuration
 # -------------------------------
 API_URL = "http://localhost:8000"
+# Backend stages shown under an answer, in pipeline order (the rest stay in the API response)
+TIMING_STAGES = ["embed", "retrieval", "rerank", "context", "llm_queue", "llm"]
+DOCS_PAGE_SIZE = 500  # docs fetched per GET /docs request
+DOCS_REFRESH_SECONDS = 5  # reruns within this long of the last check reuse the cached doc list
+JOB_TIMEOUT_SECONDS = 600  # stop waiting on an ingestion job after this long (it keeps running)
+
+
+# -------------------------------
+# Helpers
+# -------------------------------
+def iter_sse(response):
+    """Yield (event, data) pairs from a Server-Sent Events response."""
+    event, data_lines = "message", []
+    for raw in response.iter_lines():
+        line = raw.decode("utf-8")
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+
+def refresh_docs(force=False):
+    """
+    Bring st.session_state.docs up to date. Streamlit reruns this script on every
+    widget interaction, so the cached list is reused for DOCS_REFRESH_SECONDS and
+    then revalidated with its ETag; the backend answers 304 while nothing changed.
+    `force` skips the wait (after an upload or a delete).
+    """
+    state = st.session_state
+    if not force and time.time() - state.docs_checked_at < DOCS_REFRESH_SECONDS:
+        return
+    headers = {"If-None-Match": state.docs_etag} if state.docs_etag else {}
+    r = requests.get(f"{API_URL}/docs", params={"limit": DOCS_PAGE_SIZE}, headers=headers)
+    if r.status_code != 304:
+        r.raise_for_status()
+        page, etag = r.json(), r.headers.get("ETag")
+        version, docs = page["version"], page["docs"]
+        while page["next_offset"] is not None:
+            r = requests.get(f"{API_URL}/docs", params={"limit": DOCS_PAGE_SIZE, "offset": page["next_offset"]})
+            r.raise_for_status()
+            page = r.json()
+            if page["version"] != version:
+                # The corpus changed mid-listing; revalidate from the first page next time
+                etag = None
+            docs += page["docs"]
+        state.docs, state.docs_etag = docs, etag
+    state.docs_checked_at = time.time()
+
 
 # -------------------------------
 # Session state initialization
 # -------------------------------
 if "docs" not in st.session_state:
     st.session_state.docs = []  # [{"id": ..., "filename": ...}]
+    st.session_state.docs_etag = None  # corpus version the cached list was fetched at
+    st.session_state.docs_checked_at = 0.0
 if "history" not in st.session_state:
     st.session_state.history = []  # [{"question":..., "answer":..., "sources":..., "elapsed_time":...}]
 if "notes" not in st.session_state:
@@ -28,50 +82,81 @@ if "uploaded_file" not in st.session_state:
 with st.sidebar:
     st.header("📑 Documents")
 
-    # Fetch doc list from backend
+    # Doc list from the backend, cached across reruns
     try:
-        r = requests.get(f"{API_URL}/docs")
-        docs_data = r.json()
-        if isinstance(docs_data, list):
-            st.session_state.docs = docs_data
-        elif isinstance(docs_data, dict) and "docs" in docs_data:
-            st.session_state.docs = docs_data["docs"]
-        else:
-            st.session_state.docs = []
+        refresh_docs()
     except Exception:
         st.warning("⚠️ Backend not running or no docs indexed")
-        st.session_state.docs = []
+        st.session_state.docs, st.session_state.docs_etag = [], None
 
-    # Show existing docs
+    # Show existing docs; ticked ones limit the search to those documents
+    if st.session_state.docs:
+        st.caption("Tick documents to search only those (none ticked = all).")
+    selected_docs = []
     for doc in st.session_state.docs:
         cols = st.columns([3, 1])
-        cols[0].text(doc.get("filename", doc.get("name", "unknown")))
+        filename = doc.get("filename", doc.get("name", "unknown"))
+        if cols[0].checkbox(filename, key=f"sel_{filename}"):
+            selected_docs.append(filename)
         if cols[1].button("❌", key=f"rm_{doc.get('id', doc.get('filename'))}"):
             try:
                 resp = requests.delete(f"{API_URL}/docs/{doc.get('filename')}")
                 resp.raise_for_status()
                 st.success(f"Removed {doc.get('filename')}")
-                # Refresh doc list
-                r = requests.get(f"{API_URL}/docs")
-                st.session_state.docs = r.json() if isinstance(r.json(), list) else r.json().get("docs", [])
+                refresh_docs(force=True)
             except Exception as e:
                 st.error(f"Failed to remove {doc.get('filename')}: {e}")
 
     # Upload new document
     uploaded = st.file_uploader("➕ Add document", type=["pdf", "docx", "txt"])
     if uploaded and st.session_state.uploaded_file != uploaded.name:
-        with st.spinner(f"Uploading {uploaded.name}..."):
-            files = {"file": (uploaded.name, uploaded.getvalue())}
+        files = {"file": (uploaded.name, uploaded.getvalue())}
+        try:
+            resp = requests.post(f"{API_URL}/docs", files=files)
+            resp.raise_for_status()
+            job = resp.json()
+            st.session_state.uploaded_file = uploaded.name
+
+            # Ingestion runs in the background; poll its job until it finishes
+            progress = st.progress(0.0, text=f"Queued {uploaded.name}...")
+            status_url = f"{API_URL}{job['status_url']}"
+            deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
             try:
-                resp = requests.post(f"{API_URL}/docs", files=files)
-                resp.raise_for_status()
-                st.success(f"Uploaded {uploaded.name}")
-                st.session_state.uploaded_file = uploaded.name
-                # Refresh doc list
-                r = requests.get(f"{API_URL}/docs")
-                st.session_state.docs = r.json() if isinstance(r.json(), list) else r.json().get("docs", [])
-            except Exception as e:
-                st.error(f"Upload failed: {e}")
+                while True:
+                    resp = requests.get(status_url, timeout=10)
+                    resp.raise_for_status()
+                    job = resp.json()
+                    progress.progress(job.get("progress", 0.0), text=f"{uploaded.name}: {job.get('stage')}")
+                    if job.get("status") in ("done", "failed") or time.monotonic() > deadline:
+                        break
+                    time.sleep(0.5)
+            finally:
+                progress.empty()
+
+            result = job.get("result") or {}
+            if job.get("status") not in ("done", "failed"):
+                st.error(
+                    f"Gave up waiting for {uploaded.name} after {JOB_TIMEOUT_SECONDS}s; "
+                    "it is still being ingested and will appear in the list when done"
+                )
+            elif job["status"] == "failed":
+                st.error(f"Ingestion of {uploaded.name} failed: {job.get('error')}")
+            elif result.get("skipped") == "unchanged":
+                st.info(f"{uploaded.name} is unchanged; nothing to re-index")
+            elif result.get("skipped") == "duplicate":
+                message = f"{uploaded.name} has the same content as {result['duplicate_of']}; not indexed again"
+                if result.get("chunks_replaced"):
+                    message += " (its previous version was removed)"
+                    refresh_docs(force=True)
+                st.info(message)
+            else:
+                message = f"Uploaded {uploaded.name} ({result['chunks_added']} chunks"
+                if result.get("pages_skipped"):
+                    message += f", {result['pages_skipped']} duplicate pages skipped"
+                st.success(message + ")")
+                refresh_docs(force=True)
+        except Exception as e:
+            st.error(f"Upload failed: {e}")
 
 # -------------------------------
 # Main Tabs
@@ -94,43 +179,80 @@ with tab1:
         "Allow fallback to LLM knowledge if context is insufficient",
         value=allow_fallback_default
     )
+    retrieval_mode = st.selectbox(
+        "Retrieval mode",
+        ["vector", "hybrid", "lexical"],
+        help="hybrid fuses semantic and keyword (BM25) search; lexical is best for exact identifiers"
+    )
+
+    if selected_docs:
+        st.caption(f"🔎 Searching {len(selected_docs)} selected document(s)")
 
     if query:
-        with st.spinner("Thinking..."):
-            try:
-                start_time = time.time()
-                r = requests.post(
-                    f"{API_URL}/ask",
-                    json={"question": query, "allow_fallback": allow_fallback}
-                )
-                elapsed_time = time.time() - start_time
+        st.markdown("### 🧠 Answer")
+        answer_box = st.empty()
+        answer_box.markdown("_Thinking..._")
+        result = None
+        answer = ""
+        first_token_time = None
+        try:
+            start_time = time.time()
+            payload = {"question": query, "allow_fallback": allow_fallback, "retrieval_mode": retrieval_mode}
+            if selected_docs:
+                payload["docs"] = selected_docs
+            r = requests.post(f"{API_URL}/ask/stream", json=payload, stream=True)
+            r.raise_for_status()
 
-                r.raise_for_status()
-                result = r.json()
-                result["elapsed_time"] = elapsed_time
-                result["question"] = query  # ensure stored in history
-            except Exception as e:
-                st.error(f"Query failed: {e}")
-                result = None
+            # Render tokens as they arrive
+            for event, data in iter_sse(r):
+                if event == "token":
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    answer += data["content"]
+                    answer_box.markdown(answer)
+                elif event == "error":
+                    raise RuntimeError(data.get("error"))
+                elif event == "done":
+                    result = data
+                    result["elapsed_time"] = time.time() - start_time
+                    result["first_token_time"] = first_token_time
+                    result["question"] = query  # ensure stored in history
+        except Exception as e:
+            st.error(f"Query failed: {e}")
+            result = None
 
         if result:
             # Save to history
             st.session_state.history.append(result)
 
-            # Display answer
-            st.markdown("### 🧠 Answer")
-            st.write(result.get("answer", ""))
+            # Display final answer
+            answer_box.markdown(result.get("answer", ""))
 
             # Show response time
-            st.caption(f"⏱️ Response time: {result['elapsed_time']:.2f} seconds")
+            if result.get("first_token_time") is not None:
+                st.caption(
+                    f"⏱️ Response time: {result['elapsed_time']:.2f} seconds "
+                    f"(first token after {result['first_token_time']:.2f} s)"
+                )
+            else:
+                st.caption(f"⏱️ Response time: {result['elapsed_time']:.2f} seconds")
+            if result.get("cached"):
+                st.caption(f"⚡ Answered from cache ({result['cached']} match)")
+            elif result.get("timings"):
+                timings = result["timings"]
+                st.caption("⏱️ " + ", ".join(
+                    f"{stage}: {timings[stage]:.2f} s" for stage in TIMING_STAGES if stage in timings
+                ))
 
             # Sources expandable
             sources = result.get("sources", [])
             if sources:
                 with st.expander("📂 Sources"):
                     for src in sources:
+                        conf = src.get("confidence")
+                        conf_text = f"{conf * 100:.1f}%" if conf is not None else "n/a"
                         st.markdown(
-                            f"- **{src.get('doc','')}** (conf: {src.get('confidence', 0) * 100:.1f}%)\n\n"
+                            f"- **{src.get('doc','')}** (conf: {conf_text})\n\n"
                             f"  {src.get('snippet','')}"
                         )
 
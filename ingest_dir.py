@@ -0,0 +1,65 @@
+import argparse
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from config import DATA_DIR, EMBEDDING_DIR  # noqa: E402
+from db import init_db  # noqa: E402
+from embeddings import model_id  # noqa: E402
+from index import init_index  # noqa: E402
+from ingest import BULK_INGEST_STAGES, ingest_files  # noqa: E402
+from jobs import Job  # noqa: E402
+from utils import allowed_file  # noqa: E402
+
+
+def find_files(directory, recursive=True):
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if allowed_file(name):
+                yield os.path.join(root, name)
+        if not recursive:
+            break
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest every PDF/DOCX in a directory.")
+    parser.add_argument("directory")
+    parser.add_argument("--no-recursive", action="store_true", help="only ingest the top-level directory")
+    args = parser.parse_args()
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(EMBEDDING_DIR, exist_ok=True)
+    init_db()
+    init_index(model_id())
+
+    # Copy into DATA_DIR so bulk-ingested docs are stored like uploads
+    file_paths = []
+    for src in find_files(args.directory, recursive=not args.no_recursive):
+        dest = os.path.join(DATA_DIR, os.path.basename(src))
+        if os.path.abspath(src) != os.path.abspath(dest):
+            shutil.copy2(src, dest)
+        file_paths.append(dest)
+
+    if not file_paths:
+        print(f"No PDF/DOCX files found in {args.directory}", file=sys.stderr)
+        return
+
+    job = Job("bulk_ingest", BULK_INGEST_STAGES)
+    result = ingest_files(job, file_paths)
+
+    for failure in result["files_failed"]:
+        print(f"FAILED {failure['filename']}: {failure['error']}", file=sys.stderr)
+    for skipped in result["files_skipped"]:
+        reason = f"duplicate of {skipped['duplicate_of']}" if "duplicate_of" in skipped else "unchanged"
+        print(f"SKIPPED {skipped['filename']}: {reason}")
+    print(
+        f"Ingested {result['files_ingested']} files / {result['chunks_added']} chunks "
+        f"({result['pages_skipped']} near-duplicate pages skipped) in {result['elapsed_time']:.1f}s "
+        f"({result['files_per_sec']:.1f} files/s, {result['chunks_per_sec']:.1f} chunks/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()